@@ -1,19 +1,19 @@
 # -*- coding: utf-8 -*-
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 import logging
 import random
-import copy
 from collections import defaultdict
 import math
+from time import perf_counter
 
 import geometry
-from spine import Spine
-from utils import sign, AutoSaveAnimation
-from general import random_spines, random_spine, display, spines_plot
+from spine import Spine, SpineSnapshot
+from utils import sign
+from general import random_spines, random_pose
 from geometry import Point, iSP
 from contact_manager import ContactManager
+from trajectory import NullRecorder
+from proposals import make_proposal
+from schedule import GeometricSchedule, make_schedule
 
 logger = logging.getLogger(__name__)
 
@@ -21,79 +21,239 @@ INF = float("infinity")
 ALPHA = 0.1
 EPS = 1.0e-6
 
-def anealing(H, W, L, N) -> list[Spine]:
+def anealing(H, W, L, N, spines=None, rng=random, recorder=None,
+             info=None, movable=None, stats=None, callback=None,
+             proposal=None, schedule=None, checkpoint=None) -> list[Spine]:
     """
     アニーリングによってエネルギー０を目指すアプローチで針の位置・向きを求める。
+
+    spines: 初期配置。Spineのリストまたはspine.SpineArray。Noneの場合はラン
+    ダムに生成する。与えた場合はNは無視され、spinesを直接更新する。
+
+    rng: random.Randomのインスタンス。省略時はrandomモジュールの乱数を使う。
+    recorder: 生成過程を記録するレコーダー（trajectory.TrajectoryRecorderな
+    ど）。Noneの場合は記録しない。
+    info: dictを与えると、返す配置のエネルギー（"energy"）と反復回数
+    （"epochs"）を書き込む。
+    movable: 動かしてよい針の添字のリスト。Noneの場合はすべての針を動かす。
+    動かさない針同士の接触は解消できないので、エネルギーには含めない。
+    stats: instrument.Statsを与えると、採択・棄却の数、接触判定の回数、各段階
+    （step, record）の時間を集計する。Noneの場合は集計しない。
+    callback: 各反復の後に callback(epoch, エネルギー, stats) を呼ぶ。Trueを
+    返すとその時点で打ち切る。Noneの場合は呼ばない。
+    proposal: 移動の提案方法。proposals.Proposalのインスタンス、または
+    proposals.make_proposalの種類名（"contacted", "local", "window",
+    "adaptive"など）。Noneの場合は針を一様に選び、領域内に一様に置き直す。
+    schedule: 温度スケジュールと終了条件。schedule.Scheduleのインスタンス、
+    またはschedule.make_scheduleの種類名（"geometric", "adaptive", "reheat"）。
+    Noneの場合はALPHA**(epoch/3000)で温度を下げ、3000回で打ち切る。時間で打
+    ち切るにはGeometricSchedule(max_iteration=None, time_budget=秒)などを渡す。
+    checkpoint: checkpoint.Checkpointerを与えると、計算の途中の状態を定期的に
+    保存する。反復回数の上限で終えた場合も保存する。checkpoint.resumeで再開
+    でき、中断しなかった場合と同じ結果になる。
+
+    途中で得られた最もエネルギーの低い配置をspinesに書き戻して返す。
     """
     # 最大反復回数を制御するグローバルパラメータ
     max_iteration = 3000
+    if schedule is None:
+        schedule = GeometricSchedule(max_iteration, alpha=ALPHA)
+    elif isinstance(schedule, str):
+        schedule = make_schedule(schedule)
+    # 記録する間隔
+    record_interval = max(1, (schedule.max_iteration or max_iteration) // 40)
 
     # ランダムな生成
-    spines = random_spines(H, W, L, N)
-    cm = ContactManager()
-    for spine in spines:
-        cm.register(spine)
+    if spines is None:
+        spines = random_spines(H, W, L, N, rng)
+    N = len(spines)
+    if movable is not None:
+        movable = list(movable)
+    if recorder is None:
+        recorder = NullRecorder()
+    if isinstance(proposal, str):
+        proposal = make_proposal(proposal)
+    if proposal is not None:
+        proposal.prepare(movable)
+    cm = ContactManager.from_spines(spines, index="grid", cell_size=L,
+                                    stats=stats)
 
-    with AutoSaveAnimation("anealing.gif", figsize=(8, 6)) as ani:
-        ax = ani.add_subplot(1, 1, 1, aspect="equal")
-        ani.frames.append(spines_plot(H, W, spines, ax).get_children())
+    # 動かさない針同士の接触ペア数。移動によって変わらない。
+    fixed_pairs = 0
+    if movable is not None:
+        fixed = set(range(N)) - set(movable)
+        fixed_pairs = sum(1 for i in fixed for j in cm.E[i]
+                          if i < j and j in fixed)
 
-        e = eval(H, W, spines, cm)
+    e = eval(H, W, spines, cm) - fixed_pairs
+    recorder.record(0, spines, e)
 
-        best_e = e
-        best_state = copy.deepcopy(spines)
+    best_e = e
+    best_state = SpineSnapshot(spines)
 
-        for epoch in range(max_iteration):
-            logger.debug(f"{epoch=}/{max_iteration}")
+    state = {
+        "solver": "anealing",
+        "H": H, "W": W, "spines": spines, "cm": cm,
+        "e": e, "best_e": best_e, "best_state": best_state, "epoch": 0,
+        "schedule": schedule, "proposal": proposal, "movable": movable,
+        "fixed_pairs": fixed_pairs, "record_interval": record_interval,
+        "rng": None,
+    }
+    return _run(state, rng, recorder, info, stats, callback, checkpoint)
 
-            cp = list(cm.contact_pairs())
-            if len(cp) == 0:
-                logger.debug("iteration end")
-                break
+def resume_anealing(state: dict, recorder=None, info=None, stats=None,
+                    callback=None, checkpoint=None, max_iteration=None,
+                    time_budget=None):
+    """
+    checkpoint.load_checkpointで読み込んだ状態からanealingを再開する。
+    引数はanealingと同じ。max_iteration, time_budgetを与えると、温度スケジュー
+    ルの上限を変更して計算を延長する（その場合、温度は中断しなかった場合と異なる）。
+    Noneのものは保存した値のまま変更しない。
+    """
+    rng = random.Random()
+    rng.setstate(state["rng"])
+    schedule = state["schedule"]
+    if max_iteration is not None:
+        schedule.max_iteration = max_iteration
+        schedule.stopped = False
+    if time_budget is not None:
+        schedule.time_budget = time_budget
+        schedule.stopped = False
+    state["cm"].stats = stats
+    if recorder is None:
+        recorder = NullRecorder()
+    recorder.record(state["epoch"], state["spines"], state["e"])
+    return _run(state, rng, recorder, info, stats, callback, checkpoint)
 
-            # ランダムに一つのspineを選択し、新しい位置を決める。
-            i = random.randint(0, N-1)
-            spine = random_spine(H, W, L, identifier=f"{i}")
-            orig_spine = cm.objects[i]  # FIX
+def _run(state, rng, recorder, info, stats, callback, checkpoint):
+    """
+    anealingの反復。stateの内容から始め、終了後の配置を返す。
+    """
+    H, W = state["H"], state["W"]
+    spines = state["spines"]
+    cm = state["cm"]
+    e = state["e"]
+    best_e = state["best_e"]
+    best_state = state["best_state"]
+    epoch = state["epoch"]
+    schedule = state["schedule"]
+    proposal = state["proposal"]
+    movable = state["movable"]
+    fixed_pairs = state["fixed_pairs"]
+    record_interval = state["record_interval"]
 
-            # 置き換わった場合の評価値
-            next_e = e - \
-                len([s for s in cm.overlapped_objects_with_known(orig_spine)]) \
-                + len([s for s in cm.overlapped_objects_with_new(spine)
-                       if s != orig_spine])
+    debug = logger.isEnabledFor(logging.DEBUG)
+    schedule.start()
+    while not schedule.done(epoch):
+        if checkpoint is not None and checkpoint.due(epoch):
+            state.update(e=e, best_e=best_e, epoch=epoch, rng=rng.getstate())
+            checkpoint.save(state)
 
-            prob = probability(e, next_e, temperature(epoch/max_iteration))
-            if random.uniform(0, 1) <= prob:
-                # 置き換える
-                orig_spine.update(spine.center, spine.theta, spine.l)
-                e = next_e
-                cm.update(orig_spine)
+        if debug:
+            logger.debug(f"{epoch=}/{schedule.max_iteration}")
 
-                if e < best_e:
-                    best_e = e
-                    best_state = copy.deepcopy(spines)
+        if cm.num_contact_pairs == fixed_pairs:
+            logger.debug("iteration end")
+            break
 
-                if e < EPS:
-                    break
+        t = schedule.temperature(epoch)
+        if stats is None:
+            e, move = metropolis_step(H, W, cm, e, t, rng, movable, proposal,
+                                      schedule)
+        else:
+            start = perf_counter()
+            e, move = metropolis_step(H, W, cm, e, t, rng, movable, proposal,
+                                      schedule)
+            stats.add_time("step", perf_counter() - start)
+            stats.count("rejected" if move is None else "accepted")
+        if move is not None:
+            best_state.mark(move.index)
+            recorder.mark(move.index)
+            if e < best_e:
+                best_e = e
+                best_state.capture(spines)
 
-            if logger.level == logging.DEBUG:
-                logger.debug(f"{e=:.3f}")
+            if e < EPS:
+                break
+        schedule.update(epoch, e)
 
-            # 描画
-            if epoch % (max_iteration//40) == 0:
-                ax = ani.add_subplot(1, 1, 1, aspect="equal")
-                ani.frames.append(spines_plot(H, W, spines, ax).get_children())
+        if debug:
+            logger.debug(f"{e=:.3f}")
 
-            # 接触情報を更新
-            cp = list(cm.contact_pairs())
+        # 記録
+        if epoch % record_interval == 0:
+            if stats is None:
+                recorder.record(epoch, spines, e)
+            else:
+                with stats.timer("record"):
+                    recorder.record(epoch, spines, e)
 
+        if callback is not None and callback(epoch, e, stats):
+            break
+        epoch += 1
+    else:
+        # 反復回数の上限で終えた場合は、延長できるように保存しておく
+        if checkpoint is not None:
+            state.update(e=e, best_e=best_e, epoch=epoch, rng=rng.getstate())
+            checkpoint.save(state)
+
+    if e > best_e:
+        # 最良の配置に戻す
+        for i in best_state.dirty:
+            recorder.mark(i)
+        best_state.restore(spines)
+    recorder.record(epoch, spines, best_e)
+    if info is not None:
+        info["energy"] = best_e
+        info["epochs"] = epoch
     return spines
 
+def metropolis_step(H, W, cm, e, t, rng=random, movable=None, proposal=None,
+                    schedule=None):
+    """
+    ランダムに一つの針を選んで新しい位置を決め、温度tのもとで採否を決める。
+
+    e: 現在のエネルギー
+    rng: random.Randomのインスタンス。省略時はrandomモジュールの乱数を使う。
+    movable: 選んでよい針の添字のリスト。Noneの場合はすべての針から選ぶ。
+    proposal: 移動の提案方法（proposals.Proposal）。movableを設定済みである
+    こと。Noneの場合は針を一様に選び、領域内に一様に置き直す。
+    schedule: 採否の結果を伝える温度スケジュール（schedule.Schedule）。
+    戻り値は (更新後のエネルギー, 採択した場合はMoveProposal、棄却した場合はNone)。
+    """
+    # ランダムに一つのspineを選択し、新しい位置を決める。
+    if proposal is not None:
+        i, center, theta = proposal.propose(H, W, cm, rng)
+    elif movable is None:
+        i = rng.randint(0, len(cm.objects)-1)
+        center, theta = random_pose(H, W, rng)
+    else:
+        i = movable[rng.randrange(len(movable))]
+        center, theta = random_pose(H, W, rng)
+
+    # 置き換わった場合の評価値
+    delta, move = cm.propose_move(cm.objects[i], center, theta)
+    next_e = e + delta
+
+    prob = probability(e, next_e, t)
+    accepted = rng.uniform(0, 1) <= prob
+    if proposal is not None:
+        proposal.feedback(accepted, delta)
+    if schedule is not None:
+        schedule.feedback(accepted, delta)
+    if accepted:
+        # 置き換える
+        cm.commit(move)
+        return next_e, move
+    else:
+        cm.rollback(move)
+        return e, None
+
 def eval(H, W, state: list[Spine], cm):
     """
     針の状態に対する評価値
     """
-    return len(list(cm.contact_pairs()))
+    return cm.num_contact_pairs
 
 def temperature(r):
     """
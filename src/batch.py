@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# 多数の配置をまとめて生成し、結果をJSON Lines形式で書き出す。
+#
+# 例: python batch.py --H 10 --W 10 --L 3 --N 40 60 --seeds 0 100 --out out.jsonl
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from anealing import anealing
+from relaxation import relaxation
+from rsa import random_sequential_adsorption
+
+logger = logging.getLogger(__name__)
+
+ENGINES = {
+    "anealing": anealing,
+    "relaxation": relaxation,
+    "rsa": random_sequential_adsorption,
+}
+
+
+def expand_grid(grid: dict):
+    """
+    {"N": [40, 60], "L": [3]} のような辞書から、全組み合わせのdictを順に返す。
+    """
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def run_one(engine, H, W, L, N, seed, time_budget=None):
+    """
+    一つの配置を生成し、配置と指標をdictで返す。
+    乱数はseedから作った独立な乱数列のみを使うので、結果は実行順に依存しない。
+
+    time_budget: 反復を打ち切る時間（秒）。打ち切った場合は"timed_out"を
+    Trueとし、それまでで最良の配置を返す（結果は実行速度に依存する）。
+    Noneの場合は打ち切らない。
+    """
+    rng = random.Random(seed)
+    info = {}
+    start = time.perf_counter()
+    callback = None
+    timed_out = False
+    if time_budget is not None:
+        deadline = start + time_budget
+
+        def callback(epoch, e, stats):
+            nonlocal timed_out
+            timed_out = time.perf_counter() >= deadline
+            return timed_out
+    spines = ENGINES[engine](H, W, L, N, rng=rng, info=info, callback=callback)
+    wall_time = time.perf_counter() - start
+    record = {
+        "engine": engine,
+        "H": H, "W": W, "L": L, "N": N, "seed": seed,
+        "wall_time": wall_time,
+        "timed_out": timed_out,
+    }
+    # energy, epochsのほか、エンジン固有の指標も含める
+    record.update(info)
+    record["spines"] = [[s.center.x, s.center.y, s.theta, s.l] for s in spines]
+    return record
+
+
+def run_batch(grid: dict, seeds, out, engine="anealing", max_workers=None,
+              max_pending=None, time_budget=None):
+    """
+    パラメータの組み合わせgridと乱数の種seedsの直積について配置を生成する。
+
+    grid: H, W, L, Nそれぞれの値のリストを持つdict
+    seeds: 乱数の種の列
+    out: 書き込み先のファイルオブジェクト。完了したものから一行ずつ書き出す。
+    max_pending: 同時に投入しておく実行の上限。省略時はワーカー数の2倍。
+    メモリ使用量はバッチの大きさによらず、max_pendingで抑えられる。
+    time_budget: 一つの配置の生成を打ち切る時間（秒）。run_oneを参照。
+
+    書き出した件数を返す。
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine: {engine=}")
+    tasks = ((params, seed) for params in expand_grid(grid) for seed in seeds)
+
+    if max_pending is None:
+        max_pending = 2*(max_workers or os.cpu_count() or 1)
+
+    count = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for params, seed in tasks:
+            if len(pending) >= max_pending:
+                pending, n = _write_completed(pending, out)
+                count += n
+            pending.add(executor.submit(
+                run_one, engine, params["H"], params["W"], params["L"],
+                params["N"], seed, time_budget))
+        while pending:
+            pending, n = _write_completed(pending, out)
+            count += n
+    return count
+
+
+def _write_completed(pending, out):
+    """
+    いずれかの実行が完了するまで待ち、完了したものを書き出す。
+    """
+    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        out.write(json.dumps(future.result()) + "\n")
+    out.flush()
+    return pending, len(done)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="針の配置をまとめて生成し、JSON Lines形式で書き出す。")
+    parser.add_argument("--H", type=float, nargs="+", default=[10])
+    parser.add_argument("--W", type=float, nargs="+", default=[10])
+    parser.add_argument("--L", type=float, nargs="+", default=[3])
+    parser.add_argument("--N", type=int, nargs="+", default=[60])
+    parser.add_argument("--seeds", type=int, nargs=2, default=[0, 10],
+                        metavar=("START", "STOP"),
+                        help="range(START, STOP)の種を使う")
+    parser.add_argument("--engine", choices=sorted(ENGINES),
+                        default="anealing")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="一つの配置の生成を打ち切る時間（秒）")
+    parser.add_argument("--out", default="-",
+                        help="出力先のJSON Linesファイル。-は標準出力")
+    args = parser.parse_args(argv)
+
+    grid = {"H": args.H, "W": args.W, "L": args.L, "N": args.N}
+    seeds = range(*args.seeds)
+    if args.out == "-":
+        run_batch(grid, seeds, sys.stdout, args.engine, args.workers,
+                  time_budget=args.time_budget)
+    else:
+        with open(args.out, "w") as out:
+            run_batch(grid, seeds, out, args.engine, args.workers,
+                      time_budget=args.time_budget)
+    return
+
+
+if __name__ == '__main__':
+    main()
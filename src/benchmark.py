@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+# 接触判定と各エンジンのベンチマーク。結果をJSONで書き出し、実行間で比較できるようにする。
+#
+# 例: python benchmark.py --quick --out bench.json
+#     python benchmark.py --suite contact --sizes 100 1000 10000 100000
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from geometry import Point, Segment, iSP, segment_overlap_batch, \
+    segment_relation_batch
+from general import random_spines, random_pose
+from contact_manager import ContactManager
+from anealing import anealing
+from relaxation import relaxation
+from rsa import random_sequential_adsorption
+
+logger = logging.getLogger(__name__)
+
+
+def timeit(fn, min_time=0.2):
+    """
+    fnを合計min_time秒以上になるまで繰り返し呼び、一回あたりの秒数を返す。
+    """
+    n = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        n += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / n
+
+
+def region_side(N, L, density):
+    """
+    無次元密度 N L^2 / (H W) がdensityとなる正方形領域の一辺の長さ
+    """
+    return math.sqrt(N * L**2 / density)
+
+
+def bench_geometry(n_pairs=20000, seed=0):
+    """
+    Segment.relation、iSP、配列版の交差判定の処理速度
+    """
+    rng = random.Random(seed)
+    coords = [[rng.uniform(0, 10) for k in range(4)] for i in range(2*n_pairs)]
+    segments = [Segment(Point(c[0], c[1]), Point(c[2], c[3])) for c in coords]
+    pairs = list(zip(segments[:n_pairs], segments[n_pairs:]))
+    points = [(s.p1, s.p2, t.p1) for s, t in pairs]
+    a = np.array(coords[:n_pairs])
+    b = np.array(coords[n_pairs:])
+
+    t_relation = timeit(lambda: [s.relation(t) for s, t in pairs])
+    t_isp = timeit(lambda: [iSP(p, q, r) for p, q, r in points])
+    t_batch = timeit(lambda: segment_overlap_batch(a, b))
+
+    scalar = np.array([s.relation(t) for s, t in pairs])
+    agree = bool(np.array_equal(scalar, segment_relation_batch(a, b)))
+    return [
+        {"suite": "geometry", "name": "Segment.relation",
+         "pairs_per_sec": n_pairs / t_relation},
+        {"suite": "geometry", "name": "iSP",
+         "calls_per_sec": n_pairs / t_isp},
+        {"suite": "geometry", "name": "segment_overlap_batch",
+         "pairs_per_sec": n_pairs / t_batch, "agrees_with_scalar": agree},
+    ]
+
+
+def bench_contact(sizes, densities, index="grid", L=3, n_updates=1000, seed=0):
+    """
+    ContactManagerのregister、bulk_register、update、contact_pairsの規模・密度
+    に対する変化
+    """
+    results = []
+    for density in densities:
+        for N in sizes:
+            side = region_side(N, L, density)
+            rng = random.Random(seed)
+            spines = random_spines(side, side, L, N, rng)
+
+            start = time.perf_counter()
+            cm = ContactManager(index=index, **_index_options(index, side, L))
+            for spine in spines:
+                cm.register(spine)
+            t_register = time.perf_counter() - start
+
+            start = time.perf_counter()
+            ContactManager.from_spines(spines, index=index,
+                                       **_index_options(index, side, L))
+            t_bulk = time.perf_counter() - start
+
+            moves = [(rng.randrange(N), random_pose(side, side, rng))
+                     for k in range(n_updates)]
+            start = time.perf_counter()
+            for i, (center, theta) in moves:
+                spine = cm.objects[i]
+                spine.update(center, theta)
+                cm.update(spine)
+            t_update = (time.perf_counter() - start) / n_updates
+
+            start = time.perf_counter()
+            n_pairs = sum(1 for pair in cm.contact_pairs())
+            t_pairs = time.perf_counter() - start
+
+            results.append({
+                "suite": "contact", "index": index, "N": N,
+                "density": density, "side": side, "contact_pairs": n_pairs,
+                "register_total_sec": t_register,
+                "register_per_sec": N / t_register,
+                "bulk_register_sec": t_bulk,
+                "update_per_sec": 1 / t_update,
+                "contact_pairs_sec": t_pairs,
+            })
+            logger.info(results[-1])
+    return results
+
+
+def _index_options(index, side, L):
+    if index == "grid":
+        return {"cell_size": L}
+    elif index == "quadtree":
+        return {"bounds": (-L, -L, side+L, side+L)}
+    return {}
+
+
+def bench_solvers(sizes, density, seeds, L=3):
+    """
+    各エンジンの反復速度とエネルギー０に達するまでの時間
+    """
+    engines = [
+        ("anealing", anealing, {}),
+        ("relaxation", relaxation, {}),
+        ("relaxation_vectorized", relaxation, {"vectorized": True}),
+        ("rsa", random_sequential_adsorption, {}),
+    ]
+    results = []
+    for N in sizes:
+        side = region_side(N, L, density)
+        for name, engine, kwargs in engines:
+            for seed in seeds:
+                info = {}
+                start = time.perf_counter()
+                engine(side, side, L, N, rng=random.Random(seed), info=info,
+                       **kwargs)
+                wall_time = time.perf_counter() - start
+                results.append({
+                    "suite": "solver", "engine": name, "N": N,
+                    "density": density, "seed": seed,
+                    "energy": info["energy"], "epochs": info["epochs"],
+                    "wall_time": wall_time,
+                    "epochs_per_sec": info["epochs"] / wall_time,
+                    "time_to_zero": wall_time if info["energy"] == 0 else None,
+                })
+                logger.info(results[-1])
+    return results
+
+
+# 新しいプロセスでsolverを読み込み、読み込みに要した時間とmatplotlibが読み込
+# まれたかを出力する
+_STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+print(elapsed, "matplotlib" in sys.modules)
+"""
+
+
+def bench_startup(modules=("anealing", "relaxation", "rsa", "tiled"),
+                  repeat=5):
+    """
+    ヘッドレスでの起動時間。新しいプロセスで各モジュールを読み込む時間と、
+    プロセスの起動から終了までの時間の中央値を求める。
+    """
+    src = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in modules:
+        import_times = []
+        process_times = []
+        for k in range(repeat):
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SCRIPT.format(modules=module)],
+                cwd=src, capture_output=True, text=True, check=True).stdout
+            process_times.append(time.perf_counter() - start)
+            elapsed, matplotlib_loaded = out.split()
+            import_times.append(float(elapsed))
+        results.append({
+            "suite": "startup", "module": module,
+            "import_sec": sorted(import_times)[repeat//2],
+            "process_sec": sorted(process_times)[repeat//2],
+            "matplotlib_loaded": matplotlib_loaded == "True",
+        })
+        logger.info(results[-1])
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "commit": commit,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="接触判定と各エンジンのベンチマークを実行し、JSONで書き出す。")
+    parser.add_argument("--suite", nargs="+",
+                        choices=["startup", "geometry", "contact", "solver"],
+                        default=["startup", "geometry", "contact", "solver"])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 10000, 100000],
+                        help="contactで用いる針の本数")
+    parser.add_argument("--densities", type=float, nargs="+",
+                        default=[0.5, 1.0, 2.0],
+                        help="無次元密度 N L^2 / (H W)")
+    parser.add_argument("--index", default="grid",
+                        choices=["list", "grid", "quadtree"])
+    parser.add_argument("--solver-sizes", type=int, nargs="+",
+                        default=[60, 200])
+    parser.add_argument("--solver-density", type=float, default=1.5)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--quick", action="store_true",
+                        help="小さな規模のみで実行する")
+    parser.add_argument("--out", default="-",
+                        help="出力先のJSONファイル。-は標準出力")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if args.quick:
+        args.sizes = [s for s in args.sizes if s <= 1000]
+        args.solver_sizes = args.solver_sizes[:1]
+        args.seeds = args.seeds[:1]
+
+    results = []
+    if "startup" in args.suite:
+        results += bench_startup()
+    if "geometry" in args.suite:
+        results += bench_geometry()
+    if "contact" in args.suite:
+        results += bench_contact(args.sizes, args.densities, args.index)
+    if "solver" in args.suite:
+        results += bench_solvers(args.solver_sizes, args.solver_density,
+                                 args.seeds)
+
+    report = {"meta": metadata(), "args": vars(args), "results": results}
+    if args.out == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# 長時間の計算の中断と再開。
+# 計算の途中の状態（配置、接触情報、最良の配置、反復回数、温度スケジュール、
+# 乱数の状態など）をpickleで保存し、同じ状態から計算を続ける。
+import logging
+import os
+import pickle
+import tempfile
+from time import perf_counter
+
+from anealing import resume_anealing
+from relaxation import resume_relaxation
+
+logger = logging.getLogger(__name__)
+
+
+def save_checkpoint(path, state: dict):
+    """
+    stateをpathに保存する。同じディレクトリの一時ファイルに書き出してから置き
+    換えるので、書き込みの途中で中断しても以前のチェックポイントは壊れない。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return
+
+
+def load_checkpoint(path) -> dict:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class Checkpointer(object):
+    """
+    一定の時間または反復回数ごとにチェックポイントを保存する。
+    各エンジンのcheckpoint引数に渡す。
+
+    interval: 保存する間隔（秒）。Noneの場合は時間では保存しない。
+    every: 保存する間隔（反復回数）。Noneの場合は反復回数では保存しない。
+    """
+    def __init__(self, path, interval=5.0, every=None):
+        self.path = path
+        self.interval = interval
+        self.every = every
+        self.last = perf_counter()
+        self.saved = 0          # 保存した回数
+        pass
+
+    def due(self, epoch):
+        """
+        epoch回目の反復の前に保存すべきか。
+        """
+        if self.every is not None and epoch % self.every == 0:
+            return True
+        return self.interval is not None and \
+            perf_counter() - self.last >= self.interval
+
+    def save(self, state: dict):
+        start = perf_counter()
+        save_checkpoint(self.path, state)
+        self.last = perf_counter()
+        self.saved += 1
+        logger.debug("checkpoint %s at epoch %s (%.3f sec)", self.path,
+                     state.get("epoch"), self.last - start)
+        return
+
+
+def resume(path, **kwargs):
+    """
+    チェックポイントから計算を再開し、エンジンの戻り値を返す。
+    kwargsは各エンジンの再開関数（anealing.resume_anealing、
+    relaxation.resume_relaxation）に渡す。
+    """
+    state = load_checkpoint(path)
+    solver = state.get("solver")
+    if solver == "anealing":
+        return resume_anealing(state, **kwargs)
+    elif solver == "relaxation":
+        return resume_relaxation(state, **kwargs)
+    raise ValueError(f"unknown solver in checkpoint: {solver=}")
@@ -1,50 +1,240 @@
 # -*- coding: utf-8 -*-
 import itertools
 import logging
+from time import perf_counter
+import numpy as np
 from spine import Spine
+from geometry import Point, segment_overlap_batch
 from collections import defaultdict
+from spatial_index import make_index, bbox_pairs
 
 logger = logging.getLogger(__name__)
 
+
+class IndexedSet(object):
+    """
+    追加・削除・ランダムな要素の取り出しがO(1)の集合。
+    要素を配列に詰めて保持し、削除時は末尾の要素で穴を埋める。
+    """
+    def __init__(self, items=()):
+        self.items = []         # 要素の配列
+        self.position = {}      # 要素から配列の添字を得るマッピング
+        for x in items:
+            self.add(x)
+        pass
+
+    def add(self, x):
+        if x not in self.position:
+            self.position[x] = len(self.items)
+            self.items.append(x)
+        return
+
+    def discard(self, x):
+        k = self.position.pop(x, None)
+        if k is None:
+            return
+        last = self.items.pop()
+        if k < len(self.items):
+            self.items[k] = last
+            self.position[last] = k
+        return
+
+    def choice(self, rng):
+        """
+        rng（random.Randomまたはrandomモジュール）を用いて一様に一つ選ぶ。
+        """
+        return self.items[rng.randrange(len(self.items))]
+
+    def __contains__(self, x):
+        return x in self.position
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __repr__(self):
+        return f"<IndexedSet {self.items}>"
+
+
+class MoveProposal(object):
+    """
+    ContactManager.propose_moveが返す試行移動。
+    移動後の接触相手を保持しており、commitでそのまま反映できる。
+    """
+    __slots__ = ("index", "center", "theta", "neighbors", "delta", "version")
+
+    def __init__(self, index, center, theta, neighbors, delta, version):
+        self.index = index          # 移動するオブジェクトの添字
+        self.center = center        # 移動後の中心座標
+        self.theta = theta          # 移動後の角度
+        self.neighbors = neighbors  # 移動後に接触するオブジェクトの添字
+        self.delta = delta          # 移動による接触ペア数の変化
+        self.version = version      # 提案時点のContactManagerの版
+
+    def __repr__(self):
+        return f"<MoveProposal {self.index=}, {self.delta=}>"
+
+
 class ContactManager(object):
     """
     オブジェクトを登録し、オブジェクト間の接触判定を管理する。
-    全オブジェクトを操作する実装。必要なら四分木
+    バウンディングボックスが重なる候補を空間インデックスで絞り込み（ブロード
+    フェーズ）、候補に対してのみ厳密な交差判定を行う。
+    オブジェクトにはSpineのほか、spine.SpineArrayの要素（SpineView）も登録
+    できる。
+
+    index: 空間インデックスの種類。"list"（総当たり）、"grid"、"quadtree"
+    のいずれか、またはinsert/remove/update/queryを持つオブジェクト。
+    index_options: 空間インデックスの生成時の引数。
+
+    隣接関係は集合で保持し、接触ペア数、各オブジェクトの接触数、接触してい
+    るオブジェクトの集合をregister/updateのたびに差分で更新する。
+    隣接集合は添字の昇順に走査するので、結果は集合の内部の順序によらない
+    （pickleで保存・復元しても同じ結果になる）。
+
+    stats: instrument.Statsを与えると、候補数・厳密な判定の回数・更新回数と、
+    ブロードフェーズ・厳密な判定に要した時間を集計する。Noneの場合は集計しない。
     """
-    def __init__(self):
+    def __init__(self, index=None, stats=None, **index_options):
         self.objects = []       # オブジェクトのリスト
         self.mapping = {}       # オブジェクトから配列の添字を得るマッピング
-        self.E = []
+        self.E = []             # 添字から接触している添字の集合を得る隣接リスト
+        self.n_pairs = 0        # 接触しているペアの数
+        self.contacted = IndexedSet()   # 接触しているオブジェクトの添字
+        self.version = 0        # 接触情報を変更するたびに増える版番号
+        self.stats = stats      # 計測（instrument.Stats）。Noneの場合は計測しない
+        if index is None or isinstance(index, str):
+            self.index = make_index(index, **index_options)
+        else:
+            self.index = index
         pass
 
     def register(self, x: Spine):
         """オブジェクトの登録
         """
+        # これまでのオブジェクトとの接触を求める
+        overlapped = self.overlapped_objects_with_new(x)
+
+        self.version += 1
         self.objects.append(x)
-        self.E.append([])
+        self.E.append(set())
         N = len(self.objects)
         self.mapping[x] = N-1
+        self.index.insert(N-1, x.bbox())
 
         # これまでのオブジェクトとの接触を反映する
-        # O(N)
-        for other in self.overlapped_objects_with_new(x):
-            i = self.mapping[other]
-            self.E[i].append(N-1)
-            self.E[N-1].append(i)
+        for other in overlapped:
+            self._link(self.mapping[other], N-1)
+        return
+
+    @classmethod
+    def from_spines(cls, spines, index=None, stats=None, **index_options):
+        """
+        spinesをまとめて登録したContactManagerを生成する。bulk_registerを参照。
+        """
+        cm = cls(index=index, stats=stats, **index_options)
+        cm.bulk_register(spines)
+        return cm
+
+    def bulk_register(self, xs):
+        """
+        複数のオブジェクトをまとめて登録する。
+        結果（隣接関係、接触しているオブジェクトの並びを含む）はregisterを順に
+        呼んだ場合と同じだが、重なり得る組を格子による分類で一度に求め、厳密な
+        交差判定を配列で一度に行うので、O(N log N)程度で済む。
+        """
+        xs = list(xs)
+        n0 = len(self.objects)
+        for k, x in enumerate(xs):
+            self.objects.append(x)
+            self.E.append(set())
+            self.mapping[x] = n0 + k
+        self.version += len(xs)
+
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
+        # 既存のオブジェクトとの組も含めて候補を求め、新しいものを含む組に限る。
+        # 空間インデックスにはinsert/remove/update/queryしか求めないので、
+        # バウンディングボックスはオブジェクトから求める
+        all_bboxes = [x.bbox() for x in self.objects]
+        I, J = bbox_pairs(all_bboxes)
+        keep = J >= n0
+        I, J = I[keep], J[keep]
+        if stats is not None:
+            stats.add_time("broad_phase", perf_counter() - start)
+            stats.count("broad_candidates", len(I))
+            start = perf_counter()
+
+        coords = np.array([x.coords() for x in self.objects],
+                          dtype=np.float64).reshape(-1, 4)
+        overlapped = segment_overlap_batch(coords[I], coords[J])
+        I, J = I[overlapped], J[overlapped]
+        if stats is not None:
+            stats.add_time("narrow_phase", perf_counter() - start)
+            stats.count("narrow_tests", len(overlapped))
+
+        for k, bbox in enumerate(all_bboxes[n0:]):
+            self.index.insert(n0 + k, bbox)
+        # registerと同じ順（新しいものの添字、相手の添字の昇順）に反映する
+        order = np.lexsort((I, J))
+        for i, j in zip(I[order].tolist(), J[order].tolist()):
+            self._link(i, j)
         return
 
+    def _link(self, i, j):
+        self.E[i].add(j)
+        self.E[j].add(i)
+        self.n_pairs += 1
+        self.contacted.add(i)
+        self.contacted.add(j)
+        return
+
+    def _unlink(self, i, j):
+        self.E[i].discard(j)
+        self.E[j].discard(i)
+        self.n_pairs -= 1
+        if not self.E[i]:
+            self.contacted.discard(i)
+        if not self.E[j]:
+            self.contacted.discard(j)
+        return
+
+    def candidates(self, bbox):
+        """
+        bboxと重なる可能性のあるオブジェクトの添字を昇順で返す。
+        """
+        stats = self.stats
+        if stats is None:
+            return sorted(self.index.query(bbox))
+        start = perf_counter()
+        ret = sorted(self.index.query(bbox))
+        stats.add_time("broad_phase", perf_counter() - start)
+        stats.count("broad_candidates", len(ret))
+        return ret
+
     def overlapped_objects_with_new(self, x):
         """
-        未登録のオブジェクトxと重なっているオブジェクトを返す。O(N)。
+        未登録のオブジェクトxと重なっているオブジェクトを返す。
         """
+        candidates = self.candidates(x.bbox())
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
         ret = []
-        for other in self.objects:
+        for i in candidates:
+            other = self.objects[i]
             if x.is_overlapped_with_spine(other):
                 ret.append(other)
+        if stats is not None:
+            stats.add_time("narrow_phase", perf_counter() - start)
+            stats.count("narrow_tests", len(candidates))
         return ret
 
     def overlapped_objects_with_known(self, x):
-        """登録済みのオブジェクトxと重なっているオブジェクトを返す。O(N)
+        """登録済みのオブジェクトxと重なっているオブジェクトを返す。
         """
         ret = self.overlapped_objects_with_new(x)
         return [r for r in ret if r != x]
@@ -54,25 +244,150 @@ class ContactManager(object):
         登録したオブジェクトの接触情報を更新する。
         """
         i = self.mapping[x]
+        self.version += 1
+        if self.stats is not None:
+            self.stats.count("updates")
         # 既存の情報を削除する
-        for j in self.E[i]:
-            self.E[j].remove(i)
-        self.E[i] = []
+        for j in sorted(self.E[i]):
+            self._unlink(i, j)
 
         # 新しい情報を反映する
+        self.index.update(i, x.bbox())
         for other in self.overlapped_objects_with_known(x):
-            j = self.mapping[other]
-            self.E[i].append(j)
-            self.E[j].append(i)
+            self._link(i, self.mapping[other])
+        return
+
+    def update_many(self, xs):
+        """
+        登録した複数のオブジェクトの接触情報をまとめて更新する。
+        結果はupdateを順に呼んだ場合と同じだが、厳密な交差判定を配列で一度に行う。
+        """
+        idx = [self.mapping[x] for x in xs]
+        touched = set(idx)
+        self.version += 1
+        stats = self.stats
+        if stats is not None:
+            stats.count("updates", len(idx))
+        # 既存の情報を削除する
+        for i in idx:
+            for j in sorted(self.E[i]):
+                self._unlink(i, j)
+
+        # 候補のペアを集める。動いたもの同士のペアは一度だけ数える。
+        bboxes = [x.bbox() for x in xs]
+        for i, bbox in zip(idx, bboxes):
+            self.index.update(i, bbox)
+        I = []
+        J = []
+        for i, bbox in zip(idx, bboxes):
+            for j in self.candidates(bbox):
+                if j != i and (j not in touched or i < j):
+                    I.append(i)
+                    J.append(j)
+        if not I:
+            return
+
+        # 新しい情報を反映する
+        if stats is not None:
+            start = perf_counter()
+        coords = {k: self.objects[k].coords() for k in set(I) | set(J)}
+        s1 = np.array([coords[i] for i in I], dtype=np.float64)
+        s2 = np.array([coords[j] for j in J], dtype=np.float64)
+        overlaps = segment_overlap_batch(s1, s2)
+        if stats is not None:
+            stats.add_time("narrow_phase", perf_counter() - start)
+            stats.count("narrow_tests", len(I))
+        for i, j, overlapped in zip(I, J, overlaps):
+            if overlapped:
+                self._link(i, j)
         return
 
+    def propose_move(self, x, center: Point, theta):
+        """
+        登録済みのオブジェクトxを中心center、角度thetaへ動かす試行を作る。
+        近傍の問い合わせは一度だけで、オブジェクトと接触情報は変更しない。
+
+        戻り値は (接触ペア数の変化量, MoveProposal)。
+        """
+        i = self.mapping[x]
+        trial = Spine(center, theta, x.l)
+        candidates = self.candidates(trial.bbox())
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
+        neighbors = set()
+        for j in candidates:
+            if j != i and trial.is_overlapped_with_spine(self.objects[j]):
+                neighbors.add(j)
+        if stats is not None:
+            stats.add_time("narrow_phase", perf_counter() - start)
+            stats.count("narrow_tests", len(candidates))
+        delta = len(neighbors) - len(self.E[i])
+        return delta, MoveProposal(i, center, theta, neighbors, delta,
+                                   self.version)
+
+    def commit(self, move: MoveProposal):
+        """
+        propose_moveで作った試行を反映する。接触判定は再計算しない。
+        """
+        if move.version != self.version:
+            raise ValueError(f"stale move proposal: {move=}")
+        i = move.index
+        x = self.objects[i]
+        x.update(move.center, move.theta)
+        self.version += 1
+
+        old = self.E[i]
+        for j in sorted(old - move.neighbors):
+            self._unlink(i, j)
+        for j in sorted(move.neighbors - old):
+            self._link(i, j)
+        self.index.update(i, x.bbox())
+        return
+
+    def rollback(self, move: MoveProposal):
+        """
+        propose_moveで作った試行を破棄する。何も変更していないので何もしない。
+        """
+        return
+
+    @property
+    def num_contact_pairs(self):
+        """
+        接触しているペアの数。O(1)。
+        """
+        return self.n_pairs
+
+    @property
+    def num_contacted(self):
+        """
+        接触しているオブジェクトの数。O(1)。
+        """
+        return len(self.contacted)
+
+    def degree(self, x):
+        """
+        登録済みのオブジェクトxが接触しているオブジェクトの数。O(1)。
+        """
+        return len(self.E[self.mapping[x]])
+
     def contact_pairs(self):
         """
         接触しているオブジェクトのペアを返すジェネレータ
         """
         N = len(self.objects)
         for i in range(N):
-            for j in self.E[i]:
+            for j in sorted(self.E[i]):
                 if i < j:
                     yield (self.objects[i], self.objects[j])
         return
+
+    def contact_edges(self):
+        """
+        接触しているペアの添字を (E, 2) の整数配列で返す。
+        各行は i < j で、行は辞書順に並ぶ。O(接触しているオブジェクト数+E)。
+        """
+        edges = [(i, j) for i in self.contacted for j in self.E[i] if i < j]
+        edges = np.array(edges, dtype=np.intp).reshape(-1, 2)
+        order = np.lexsort((edges[:, 1], edges[:, 0]))
+        return edges[order]
@@ -3,56 +3,51 @@
 import logging
 import math
 import random
-import matplotlib
-import matplotlib.pyplot as plt
-from spine import Spine
+from spine import Spine, SpineArray
 from geometry import Point
-from utils import AutoSaveFigure
 
 logger = logging.getLogger(__name__)
-random.seed(0)
 
-def random_spines(H, W, L, N) -> list[Spine]:
+def random_spines(H, W, L, N, rng=random) -> list[Spine]:
     """
     交差を許してランダムに針の位置を決める。
+    rngはrandom.Randomのインスタンス。省略時はrandomモジュールの乱数を使う。
     """
-    return [random_spine(H, W, L, identifier=f"{i}") for i in range(N)]
+    return [random_spine(H, W, L, identifier=f"{i}", rng=rng)
+            for i in range(N)]
 
-def random_spine(H, W, L, identifier=None) -> Spine:
+def random_spine(H, W, L, identifier=None, rng=random) -> Spine:
     """
     ランダムに針の位置を決める
     """
-    x = random.uniform(0, W)
-    y = random.uniform(0, H)
-    center = Point(x, y)
-    theta = random.uniform(0, math.pi)
-    logger.debug(f"random_spines {identifier=} {x=:.3f}, {y=:.3f}, {theta=:.3f}")
+    center, theta = random_pose(H, W, rng)
+    logger.debug("random_spines identifier=%r center=%r, theta=%.3f",
+                 identifier, center, theta)
     return Spine(center, theta, L, identifier=identifier)
 
-
-def display(h, w, spines: list[Spine], fn="tmp.png"):
+def random_pose(H, W, rng=random):
     """
-    針の状態を一枚の画像で保存する
+    ランダムに針の中心座標と角度を決める
     """
-    with AutoSaveFigure(fn=fn) as fig:
-        ax = fig.add_subplot(1, 1, 1, aspect="equal")
-        spines_plot(h, w, spines, ax)
-    return
+    x = rng.uniform(0, W)
+    y = rng.uniform(0, H)
+    theta = rng.uniform(0, math.pi)
+    return Point(x, y), theta
 
-def spines_plot(h, w, spines: list[Spine], ax):
+def random_spine_array(H, W, L, N, rng=random) -> SpineArray:
     """
-    針をプロットする
+    交差を許してランダムに針の位置を決め、SpineArrayとして返す。
+    乱数の消費順はrandom_spinesと同じ。
     """
-    for spine in spines:
-        spine.plot(ax, color="black")
+    values = [(rng.uniform(0, W), rng.uniform(0, H),
+               rng.uniform(0, math.pi)) for i in range(N)]
+    cx, cy, theta = zip(*values) if N > 0 else ((), (), ())
+    return SpineArray(cx, cy, theta, L)
 
-    # 外枠
-    r = matplotlib.patches.Rectangle(xy=(0, 0), width=w, height=h,
-                                     ec='#000000', linestyle=":", fill=False)
-    ax.add_patch(r)
 
-    # 表示範囲
-    rep_spine = spines[0]
-    ax.set_xlim(-rep_spine.l/2, w+rep_spine.l/2)
-    ax.set_ylim(-rep_spine.l/2, h+rep_spine.l/2)
-    return ax
+def __getattr__(name):
+    # 描画用の関数はplottingへ移動した。matplotlibは参照された時点で読み込む。
+    if name in ("display", "spines_plot"):
+        import plotting
+        return getattr(plotting, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
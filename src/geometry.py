@@ -2,6 +2,7 @@
 from __future__ import annotations
 import math
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +14,8 @@ class Point(object):
     座標を表すクラス。
     加算、減算、乗算、絶対値、内積、外積、行列式を扱える。
     """
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -62,8 +65,7 @@ class Point(object):
         yield self.y
 
     def dot(self, other):
-        p = self*other
-        return p.x+p.y
+        return self.x*other.x + self.y*other.y
 
     def inner(self, other):
         return self.dot(other)
@@ -77,7 +79,7 @@ class Point(object):
         return Point(-self.y, self.x)
 
     def det(self, other):
-        return self.inner(-other.rotate90())
+        return self.x*other.y - self.y*other.x
 
     def outer(self, other):
         return self.det(other)
@@ -97,17 +99,17 @@ class Line(object):
         self.p2 = p2
         pass
 
+    def coords(self):
+        """
+        端点の座標を (x1, y1, x2, y2) で返す。
+        """
+        return (self.p1.x, self.p1.y, self.p2.x, self.p2.y)
+
     def relation(self, other: Line):
         """
         ニ直線の関係性を求める。
         """
-        status = (self.p1-self.p2).det(other.p1-other.p2)
-        if not (-EPS < status < EPS):
-            return self._CROSS        # 交差する
-        status = (self.p1-self.p2).det(other.p1-self.p2)
-        if not (-EPS < status < EPS):
-            return self._PARALLEL       # 平行である
-        return self._SAME            # 同一直線である
+        return line_relation_xy(*self.coords(), *other.coords())
 
     def cross(self, other: Line):
         """
@@ -116,9 +118,8 @@ class Line(object):
         status = self.relation(other)
         if status == self._CROSS:
             # 交差点を求める
-            numer = (other.p1-self.p1).det(other.p2-other.p1)
-            denom = (self.p2-self.p1).det(other.p2-other.p1)
-            return self.p1 + (self.p2-self.p1)*(numer/denom)
+            x, y = line_cross_xy(*self.coords(), *other.coords())
+            return Point(x, y)
         elif status == self._PARALLEL:
             return None
         else:
@@ -139,15 +140,23 @@ class Segment(Line):
     """
     _NOTCROSS = -2
     def relation(self, other):
-        status1 = iSP(self.p1, self.p2, other.p1) * \
-            iSP(self.p1, self.p2, other.p2) <= 0
-        status2 = iSP(other.p1, other.p2, self.p1) * \
-            iSP(other.p1, other.p2, self.p2) <= 0
-        if status1 and status2:
-            # 節点を持つ
-            return super().relation(other)
-        else:
-            return self._NOTCROSS
+        return segment_relation_xy(*self.coords(), *other.coords())
+
+    def is_overlapped(self, other) -> bool:
+        """
+        二線分が接触しているか。relationがSegment._NOTCROSS以外を返すことと同じ。
+        """
+        return segment_overlap_xy(*self.coords(), *other.coords())
+
+    def bbox(self):
+        """
+        バウンディングボックス (xmin, ymin, xmax, ymax) を求める。
+        relationはEPSの許容誤差で接触とみなすため、その分だけ広げておく。
+        """
+        x1, y1, x2, y2 = self.coords()
+        margin = 2*EPS / max(((x2-x1)**2 + (y2-y1)**2)**0.5, EPS)
+        return (min(x1, x2) - margin, min(y1, y2) - margin,
+                max(x1, x2) + margin, max(y1, y2) + margin)
 
     def dist(self, point):
         if (self.p2-self.p1).dot(point-self.p1) < -EPS:
@@ -165,15 +174,173 @@ def iSP(a, b, c):
     直線に並び、a-b-cの順 +2
     直線に並び、a-c-bの順 0
     """
-    status = (b-a).det(c-a)
+    return iSP_xy(a.x, a.y, b.x, b.y, c.x, c.y)
+
+
+# 以下は座標の浮動小数点数を直接受け取るスカラー版。Pointを生成しないので、
+# 一対の判定を繰り返す場合に速い。演算の順序はPointによる実装と同じ。
+
+def iSP_xy(ax, ay, bx, by, cx, cy):
+    """
+    iSPの座標版。
+    """
+    abx = bx - ax
+    aby = by - ay
+    acx = cx - ax
+    acy = cy - ay
+    status = abx*acy - aby*acx
     if status < -EPS:
         return -1
     elif status < EPS:
-        if (b-a).dot(c-a) < 0:
+        if abx*acx + aby*acy < 0:
             return -2
-        elif (a-b).dot(c-b) < 0:
+        elif (ax-bx)*(cx-bx) + (ay-by)*(cy-by) < 0:
             return 2
         else:
             return 0
     else:
         return 1
+
+def line_relation_xy(sx1, sy1, sx2, sy2, tx1, ty1, tx2, ty2):
+    """
+    Line.relationの座標版。
+    """
+    dx = sx1 - sx2
+    dy = sy1 - sy2
+    status = dx*(ty1-ty2) - dy*(tx1-tx2)
+    if not (-EPS < status < EPS):
+        return Line._CROSS
+    status = dx*(ty1-sy2) - dy*(tx1-sx2)
+    if not (-EPS < status < EPS):
+        return Line._PARALLEL
+    return Line._SAME
+
+def line_cross_xy(sx1, sy1, sx2, sy2, tx1, ty1, tx2, ty2):
+    """
+    交差する二直線の交点を (x, y) で返す。交差することを前提とする。
+    """
+    tdx = tx2 - tx1
+    tdy = ty2 - ty1
+    sdx = sx2 - sx1
+    sdy = sy2 - sy1
+    numer = (tx1-sx1)*tdy - (ty1-sy1)*tdx
+    denom = sdx*tdy - sdy*tdx
+    r = numer/denom
+    return sx1 + sdx*r, sy1 + sdy*r
+
+def segment_overlap_xy(sx1, sy1, sx2, sy2, tx1, ty1, tx2, ty2):
+    """
+    Segment.relationがSegment._NOTCROSS以外を返すか（接触しているか）の座標版。
+    """
+    return (iSP_xy(sx1, sy1, sx2, sy2, tx1, ty1) *
+            iSP_xy(sx1, sy1, sx2, sy2, tx2, ty2) <= 0 and
+            iSP_xy(tx1, ty1, tx2, ty2, sx1, sy1) *
+            iSP_xy(tx1, ty1, tx2, ty2, sx2, sy2) <= 0)
+
+def segment_relation_xy(sx1, sy1, sx2, sy2, tx1, ty1, tx2, ty2):
+    """
+    Segment.relationの座標版。
+    """
+    if segment_overlap_xy(sx1, sy1, sx2, sy2, tx1, ty1, tx2, ty2):
+        # 節点を持つ
+        return line_relation_xy(sx1, sy1, sx2, sy2, tx1, ty1, tx2, ty2)
+    return Segment._NOTCROSS
+
+
+# 以下は多数の線分をまとめて扱うためのNumPyによる実装。
+# 線分は (..., 4) の配列 [x1, y1, x2, y2] で表し、引数同士はブロードキャスト
+# される。一対多は (4,) と (M, 4)、多対多は segment_intersection_matrix を用いる。
+# 演算の順序はPointによる実装と揃えてあり、同じ入力に対して同じ結果を返す。
+
+def _det(px, py, qx, qy):
+    return px*qy - py*qx
+
+def _dot(px, py, qx, qy):
+    return px*qx + py*qy
+
+def _segments(s):
+    s = np.asarray(s, dtype=np.float64)
+    if s.shape[-1] != 4:
+        raise ValueError(f"segments must have shape (..., 4): {s.shape=}")
+    return s[..., 0], s[..., 1], s[..., 2], s[..., 3]
+
+def iSP_batch(ax, ay, bx, by, cx, cy):
+    """
+    iSPの配列版。各引数は座標の配列で、戻り値はint8の配列。
+    """
+    status = _det(bx-ax, by-ay, cx-ax, cy-ay)
+    ret = np.where(status < -EPS, -1, 1).astype(np.int8)
+    collinear = (-EPS <= status) & (status < EPS)
+    if np.any(collinear):
+        behind = _dot(bx-ax, by-ay, cx-ax, cy-ay) < 0
+        beyond = _dot(ax-bx, ay-by, cx-bx, cy-by) < 0
+        ret[collinear] = np.where(behind, -2, np.where(beyond, 2, 0))[collinear]
+    return ret
+
+def line_relation_batch(s, t):
+    """
+    Line.relationの配列版。s, tを直線とみなした関係を返す。
+    """
+    sx1, sy1, sx2, sy2 = _segments(s)
+    tx1, ty1, tx2, ty2 = _segments(t)
+    status1 = _det(sx1-sx2, sy1-sy2, tx1-tx2, ty1-ty2)
+    status2 = _det(sx1-sx2, sy1-sy2, tx1-sx2, ty1-sy2)
+    return np.where(~((-EPS < status1) & (status1 < EPS)), Line._CROSS,
+                    np.where(~((-EPS < status2) & (status2 < EPS)),
+                             Line._PARALLEL, Line._SAME)).astype(np.int8)
+
+def segment_overlap_batch(s, t):
+    """
+    Segment.relationがSegment._NOTCROSS以外を返すか（接触しているか）の配列版。
+    """
+    sx1, sy1, sx2, sy2 = _segments(s)
+    tx1, ty1, tx2, ty2 = _segments(t)
+    status1 = iSP_batch(sx1, sy1, sx2, sy2, tx1, ty1).astype(np.int16) * \
+        iSP_batch(sx1, sy1, sx2, sy2, tx2, ty2) <= 0
+    status2 = iSP_batch(tx1, ty1, tx2, ty2, sx1, sy1).astype(np.int16) * \
+        iSP_batch(tx1, ty1, tx2, ty2, sx2, sy2) <= 0
+    return status1 & status2
+
+def segment_relation_batch(s, t):
+    """
+    Segment.relationの配列版。
+    """
+    overlap = segment_overlap_batch(s, t)
+    return np.where(overlap, line_relation_batch(s, t),
+                    Segment._NOTCROSS).astype(np.int8)
+
+def segment_intersection_batch(s, t):
+    """
+    線分s, tの接触判定と交点をまとめて求める。
+
+    戻り値は (overlap, relation, points)。
+    overlap: 接触しているか（bool）
+    relation: Segment.relationと同じ値
+    points: (..., 2) の交点。Segment.crossと同様に、交差する場合は交点、
+    平行な場合はnan（Noneに対応）、それ以外はinf（INFに対応）とする。
+    """
+    sx1, sy1, sx2, sy2 = _segments(s)
+    tx1, ty1, tx2, ty2 = _segments(t)
+    relation = segment_relation_batch(s, t)
+    overlap = relation != Segment._NOTCROSS
+
+    cross = relation == Line._CROSS
+    numer = _det(tx1-sx1, ty1-sy1, tx2-tx1, ty2-ty1)
+    denom = _det(sx2-sx1, sy2-sy1, tx2-tx1, ty2-ty1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = numer/np.where(cross, denom, 1.0)
+    px = np.where(cross, sx1 + (sx2-sx1)*r, INF)
+    py = np.where(cross, sy1 + (sy2-sy1)*r, INF)
+    parallel = relation == Line._PARALLEL
+    px = np.where(parallel, np.nan, px)
+    py = np.where(parallel, np.nan, py)
+    return overlap, relation, np.stack([px, py], axis=-1)
+
+def segment_intersection_matrix(s, t):
+    """
+    (N, 4) の線分sと (M, 4) の線分tの全組み合わせについて
+    segment_intersection_batchを求める。戻り値の形は (N, M) と (N, M, 2)。
+    """
+    s = np.asarray(s, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    return segment_intersection_batch(s[:, None, :], t[None, :, :])
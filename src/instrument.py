@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# 実行時の計測。カウンタと区間ごとの経過時間を集計する。
+# 計測を行わない場合はStatsを渡さない（None）ことで、判定一回分の負荷のみとなる。
+import time
+from collections import defaultdict
+
+
+class Stats(object):
+    """
+    カウンタと区間ごとの経過時間を集計する。
+
+    主なカウンタ
+    - broad_candidates: ブロードフェーズが返した候補の数
+    - narrow_tests: 厳密な交差判定の回数
+    - updates: ContactManager.update（update_manyは対象ごと）の回数
+    - accepted, rejected: アニーリングで採択・棄却した移動の数
+    主な区間
+    - broad_phase, narrow_phase: 接触判定の各段階
+    - step, delta, contact_update, record: 各エンジンの反復の各段階
+    """
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        pass
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+        return
+
+    def add_time(self, name, seconds):
+        self.timers[name] += seconds
+        return
+
+    def timer(self, name):
+        """
+        with文で囲んだ区間の経過時間をnameに加算するコンテキストマネージャ
+        """
+        return _Timer(self, name)
+
+    def reset(self):
+        self.counters.clear()
+        self.timers.clear()
+        return
+
+    def as_dict(self):
+        return {"counters": dict(self.counters), "timers": dict(self.timers)}
+
+    def __repr__(self):
+        return f"<Stats {self.as_dict()}>"
+
+
+class _Timer(object):
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        return
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# 最大密度（ジャミング）の探索。
+# 領域H×Wに長さLの針を重ならずに置ける最大の本数Nを、アニーリングで配置を
+# 求められるかどうかを調べながら探す。各試行（プローブ）は直前に得られた重な
+# りのない配置に針を書き足したものから始める（ウォームスタート）。
+import logging
+import random
+from time import perf_counter
+
+from spine import Spine
+from general import random_pose, random_spines
+from contact_manager import ContactManager
+from anealing import anealing
+from schedule import GeometricSchedule, PlateauDetector
+
+logger = logging.getLogger(__name__)
+
+
+def jamming(H, W, L, n_max=None, attempts=2, probe_iterations=3000,
+            probe_time=None, patience=500, t0=0.5, time_budget=None,
+            proposal="adaptive", max_attempts=100, warm_start=True, seed=0,
+            level=0.95, info=None) -> list[Spine]:
+    """
+    重ならずに置ける針の最大の本数を探索する。
+
+    1. RSA（rsa.random_sequential_adsorptionの手順１）で置けなくなるまで針を
+       置き、その本数を下限とする
+    2. 下限の配置に針を書き足してアニーリングし、重なりがなくなれば下限を
+       更新する。書き足す本数は成功するたびに倍にする
+    3. 失敗した本数を上限として、下限との間を二分探索する
+    4. 上限での失敗が、上限より一本少ない配置から始めたものでなければ、その
+       配置から上限を試し直す。成功すれば2に戻る
+
+    アニーリングが失敗しても配置が存在しないとは限らないので、各本数で
+    attempts回まで乱数を変えて試し、すべて失敗した場合に失敗とみなす。
+
+    n_max: 探索する本数の上限。Noneの場合は上限を設けない。
+    probe_iterations, probe_time: 一回の試行の反復回数・時間（秒）の上限。
+    patience: 試行を打ち切る停滞の長さ。最良のエネルギーがpatience回の反復の
+    間下がらなければ、その試行は失敗とする（schedule.PlateauDetector）。
+    t0: 試行の初期温度。重なりのない配置から始めるので低めにする。
+    time_budget: 探索全体の時間（秒）の上限。超えた場合はそれまでの結果を返す。
+    proposal: anealingの提案方法。
+    max_attempts: 針を書き足すときに、重ならない位置を探す回数。
+    warm_start: Falseの場合は各試行をランダムな配置から始める（比較用）。
+    seed: 乱数の種。各試行は種、始めた配置の本数、本数、試行の番号から導出し
+    た乱数列を使う。
+    level: 信頼水準。
+    info: dictを与えると、次の値を書き込む。
+        "n": 重なりのない配置が得られた最大の本数（推定値）
+        "upper": すべての試行が失敗した最小の本数。見つからなかった場合はNone
+        "failures": upper以上の本数で失敗した試行の数
+        "success_bound": upperでの一回の試行の成功確率の上限（信頼水準level）。
+        本数が多いほど成功しにくいと仮定し、upper以上での失敗をまとめて用いる
+        "probes": 各試行の本数、始めた配置の本数、エネルギー、反復回数、時間、
+        成否、時間の上限で打ち切ったかのリスト
+        "epochs": 反復回数の合計
+        "elapsed": 探索にかかった時間（秒）
+
+    "n"本の重なりのない配置をSpineのリストとして返す。
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1: {max_attempts=}")
+    start = perf_counter()
+    deadline = None if time_budget is None else start + time_budget
+    probes = []
+
+    spines = _extend(H, W, L, [], None, random.Random(f"{seed}:init"),
+                     max_attempts)
+    if n_max is not None:
+        spines = spines[:n_max]
+    n = len(spines)
+    upper = None
+    logger.debug("jamming: rsa placed %d", n)
+
+    def expired():
+        return deadline is not None and perf_counter() >= deadline
+
+    def probe(N):
+        for attempt in range(attempts):
+            if expired():
+                return None
+            rng = random.Random(f"{seed}:{n}:{N}:{attempt}")
+            if warm_start:
+                base = _extend(H, W, L, spines, N - n, rng, max_attempts)
+            else:
+                base = random_spines(H, W, L, N, rng)
+            result = _probe(H, W, L, base, rng, probe_iterations, probe_time,
+                            patience, t0, proposal, deadline)
+            # 探索全体の時間の上限で打ち切った試行は失敗に数えない
+            result.update(N=N, base=n, attempt=attempt,
+                          truncated=not result["feasible"] and expired())
+            probes.append(result)
+            logger.debug("jamming: %r", result)
+            if result["feasible"]:
+                return base
+        return None
+
+    step = max(1, n // 8)
+    while not expired():
+        # 成功するたびに書き足す本数を倍にし、失敗するまで増やす
+        while upper is None and (n_max is None or n < n_max):
+            N = n + step if n_max is None else min(n_max, n + step)
+            result = probe(N)
+            if result is None:
+                if expired():
+                    break
+                upper = N
+            else:
+                spines, n = result, N
+                step *= 2
+
+        # 下限と上限の間を二分探索する
+        while upper is not None and upper - n > 1 and not expired():
+            N = (n + upper) // 2
+            result = probe(N)
+            if result is None:
+                if expired():
+                    break
+                upper = N
+            else:
+                spines, n = result, N
+
+        # 上限での失敗が離れた配置から始めたものなら、今の配置から試し直す
+        if upper is None or upper - n > 1 or not warm_start or \
+                any(p["N"] == upper and p["base"] == n for p in probes):
+            break
+        result = probe(upper)
+        if result is None:
+            break
+        spines, n = result, upper
+        upper = None
+        step = 1
+
+    if info is not None:
+        failures = 0 if upper is None else \
+            sum(1 for p in probes if p["N"] >= upper and not p["feasible"]
+                and not p["truncated"])
+        info["n"] = n
+        info["upper"] = upper
+        info["failures"] = failures
+        info["success_bound"] = success_bound(failures, level)
+        info["probes"] = probes
+        info["epochs"] = sum(p["epochs"] for p in probes)
+        info["elapsed"] = perf_counter() - start
+    return spines
+
+
+def success_bound(failures, level=0.95):
+    """
+    failures回続けて失敗したときの、一回の成功確率の上限（片側、信頼水準
+    level）。成功が０回の場合のClopper-Pearsonの上限 1 - (1-level)**(1/n)。
+    """
+    if failures == 0:
+        return 1.0
+    return 1 - pow(1 - level, 1 / failures)
+
+
+def _probe(H, W, L, spines, rng, max_iteration, time_budget, patience, t0,
+           proposal, deadline):
+    """
+    spinesから一回アニーリングを行う。停滞するか時間の上限を超えると打ち切る。
+    spinesを直接更新する。試行は低い温度t0から始めるので、停滞の検出は最初
+    から行う（warmup=0）。
+    """
+    start = perf_counter()
+    schedule = GeometricSchedule(max_iteration, t0=t0, time_budget=time_budget,
+                                 plateau=PlateauDetector(patience), warmup=0)
+
+    def callback(epoch, e, stats):
+        return deadline is not None and perf_counter() >= deadline
+
+    info = {}
+    anealing(H, W, L, len(spines), spines=spines, rng=rng, info=info,
+             proposal=proposal, schedule=schedule, callback=callback)
+    return {"energy": info["energy"], "epochs": info["epochs"],
+            "seconds": perf_counter() - start,
+            "feasible": info["energy"] == 0}
+
+
+def _extend(H, W, L, spines, k, rng, max_attempts=100) -> list[Spine]:
+    """
+    重なりのない配置spinesのコピーに、k本の針を書き足したリストを返す。
+    各針は重ならない位置をmax_attempts回まで探し、見つからなければ最後の候補
+    の位置に置く。kがNoneの場合は、重ならない位置が見つからなくなるまで置く。
+    """
+    spines = [Spine(s.center, s.theta, s.l, identifier=f"{i}")
+              for i, s in enumerate(spines)]
+    cm = ContactManager.from_spines(spines, index="grid", cell_size=L)
+    count = 0
+    while k is None or count < k:
+        for attempt in range(max_attempts):
+            center, theta = random_pose(H, W, rng)
+            spine = Spine(center, theta, L, identifier=f"{len(spines)}")
+            if not cm.overlapped_objects_with_new(spine):
+                break
+        else:
+            if k is None:
+                break
+        cm.register(spine)
+        spines.append(spine)
+        count += 1
+    return spines
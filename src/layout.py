@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# 配置の保存と読み込み。列ごとに連続したバイナリのファイルに書き出し、
+# 読み込みはnp.memmapで行うので、巨大な配置も全体をメモリに載せずに扱える。
+#
+# ファイルの形式（リトルエンディアン）
+#   ヘッダ（64バイト）: マジック b"SPLY", 版 uint32, 針の数 N uint64,
+#       接触ペアの数 E uint64（接触情報を含まない場合は0）, H float64, W float64,
+#       フラグ uint32, 残りは0で埋める
+#   列: 中心x, 中心y, 角度, 長さ, 端点x1, y1, x2, y2 それぞれ float64 * N,
+#       識別子 int64 * N
+#   接触ペア: int64 * (E, 2)。フラグのHAS_EDGESが立っている場合のみ
+import logging
+import struct
+import numpy as np
+
+from spine import SpineArray
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SPLY"
+VERSION = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct("<4sIQQddI")
+HAS_EDGES = 1
+COLUMNS = ("cx", "cy", "theta", "l", "x1", "y1", "x2", "y2")
+
+
+class IdentifierColumn(object):
+    """
+    int64の識別子の列を、SpineArray.identifiersとして文字列の列に見せる。
+    """
+    def __init__(self, ids):
+        self.ids = ids
+        pass
+
+    def __getitem__(self, i):
+        return f"{self.ids[i]}"
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self[i]
+
+
+def _identifiers(spines: SpineArray):
+    """
+    識別子を整数の配列にする。識別子は整数を表す文字列であること。
+    """
+    if spines.identifiers is None:
+        return np.arange(len(spines), dtype=np.int64)
+    if isinstance(spines.identifiers, IdentifierColumn):
+        return np.asarray(spines.identifiers.ids, dtype=np.int64)
+    try:
+        return np.array([int(x) for x in spines.identifiers], dtype=np.int64)
+    except (TypeError, ValueError):
+        raise ValueError("identifiers must be integers to be saved") from None
+
+
+def save_layout(path, H, W, spines, edges=None):
+    """
+    配置をpathに保存する。
+
+    spines: Spineのリストまたはspine.SpineArray
+    edges: 接触しているペアの添字の (E, 2) 配列
+    （ContactManager.contact_edgesなど）。Noneの場合は保存しない。
+    """
+    if not isinstance(spines, SpineArray):
+        spines = SpineArray.from_spines(spines)
+    N = len(spines)
+    flags = 0
+    E = 0
+    if edges is not None:
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        flags |= HAS_EDGES
+        E = len(edges)
+
+    header = _HEADER.pack(MAGIC, VERSION, N, E, H, W, flags)
+    with open(path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        for name in COLUMNS:
+            np.ascontiguousarray(getattr(spines, name), dtype=np.float64).tofile(f)
+        _identifiers(spines).tofile(f)
+        if edges is not None:
+            edges.tofile(f)
+    return
+
+
+def read_layout_header(path):
+    """
+    保存した配置のヘッダを読み、(N, E, H, W, flags)を返す。
+    """
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SIZE)
+    if len(head) < HEADER_SIZE:
+        raise ValueError(f"not a layout file: {path=}")
+    magic, version, N, E, H, W, flags = _HEADER.unpack_from(head)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a layout file: {magic=}, {version=}")
+    return N, E, H, W, flags
+
+
+def load_layout(path, mode="r"):
+    """
+    保存した配置を読み込み、(H, W, spines, edges)を返す。
+
+    spinesはファイルをメモリマップした配列を列に持つSpineArrayで、読み込みの
+    時点ではデータを読まない。edgesは保存していない場合はNone。
+    mode: np.memmapのモード。"r"は読み込み専用、"r+"はファイルへ書き戻す、
+    "c"は変更をメモリ上のみに反映する。Noneの場合はすべてメモリに読み込む。
+    """
+    N, E, H, W, flags = read_layout_header(path)
+    if mode is None:
+        with open(path, "rb") as f:
+            f.seek(HEADER_SIZE)
+            columns = [np.fromfile(f, dtype=np.float64, count=N)
+                       for name in COLUMNS]
+            ids = np.fromfile(f, dtype=np.int64, count=N)
+            edges = None
+            if flags & HAS_EDGES:
+                edges = np.fromfile(f, dtype=np.int64, count=2*E).reshape(E, 2)
+    else:
+        offset = HEADER_SIZE
+        columns = []
+        for name in COLUMNS:
+            columns.append(_memmap(path, np.float64, mode, offset, N))
+            offset += 8*N
+        ids = _memmap(path, np.int64, mode, offset, N)
+        offset += 8*N
+        edges = None
+        if flags & HAS_EDGES:
+            edges = _memmap(path, np.int64, mode, offset, 2*E).reshape(E, 2)
+
+    spines = SpineArray.from_columns(*columns, identifiers=IdentifierColumn(ids))
+    return H, W, spines, edges
+
+
+def _memmap(path, dtype, mode, offset, count):
+    # 長さ0の配列はメモリマップできない
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(count,))
@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
 # 平面上に針を配置する。針は互いに重ならないようにする。
 # できるだけばらばらな方向を向いた針を得たい。
-import matplotlib
-import matplotlib.pyplot as plt
 import logging
 import math
+import random
 from spine import Spine
-from general import random_spines, display
+from general import random_spines
+from plotting import AnimationRecorder, display
+from layout import save_layout
 from contact_manager import ContactManager
 from relaxation import relaxation
 from anealing import anealing
+from rsa import random_sequential_adsorption
 
 logging.basicConfig(level=logging.WARNING)
 logger_levels = {
@@ -23,6 +25,9 @@ for mn, level in logger_levels.items():
 logger = logging.getLogger(__name__)
 
 def main():
+    # 実行ごとに同じ配置が得られるよう、randomモジュールの乱数の種を固定する
+    random.seed(0)
+
     # 平面のサイズ
     H, W = 10, 10
     # 針一本の長さ
@@ -30,9 +35,12 @@ def main():
     # 針の本数
     N = 60
 
-    # spines = relaxation(H, W, L, N)
-    spines = anealing(H, W, L, N)
+    with AnimationRecorder("anealing.gif", H, W) as recorder:
+        # spines = relaxation(H, W, L, N, recorder=recorder)
+        # spines = random_sequential_adsorption(H, W, L, N, recorder=recorder)
+        spines = anealing(H, W, L, N, recorder=recorder)
     display(H, W, spines, fn="output.png")
+    save_layout("output.layout", H, W, spines)
     return
 
 
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# 描画に関する機能。matplotlibに依存するものはこのモジュールにまとめ、
+# 求解のみを行う場合には読み込まない。
+import matplotlib
+import matplotlib.collections
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import collections
+import logging
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from spine import Spine, SpineArray
+from trajectory import NullRecorder, read_header, read_trajectory
+
+logger = logging.getLogger(__name__)
+
+class AutoSaveFigure(matplotlib.figure.Figure):
+    def __init__(self, fn, **kwargs):
+        self.fn = fn
+        super().__init__(**kwargs)
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        plt.tight_layout()
+        self.savefig(self.fn)
+        plt.close(self)
+        if exception_type is not None:
+            logging.error("Error has occurred.")
+            logging.error(exception_type, exception_value, traceback)
+        return
+
+class AutoSaveAnimation(matplotlib.figure.Figure):
+    def __init__(self, fn, **kwargs):
+        self.fn = fn
+        super().__init__(**kwargs)
+
+        self.frames = []
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        ani = animation.ArtistAnimation(self, self.frames, interval=100)
+        ani.save(self.fn, writer="pillow")
+        plt.close(self)
+        if exception_type is not None:
+            logging.error("Error has occurred.")
+            logging.error(exception_type, exception_value, traceback)
+        return
+
+def display(h, w, spines: list[Spine], fn="tmp.png", labels=False):
+    """
+    針の状態を一枚の画像で保存する
+    """
+    with AutoSaveFigure(fn=fn) as fig:
+        ax = fig.add_subplot(1, 1, 1, aspect="equal")
+        spines_plot(h, w, spines, ax, labels=labels)
+    return
+
+def spines_plot(h, w, spines: list[Spine], ax, labels=False):
+    """
+    針をプロットする。spinesはSpineのリストまたはSpineArray。
+    針はまとめて一つのLineCollection、中心はまとめて一つの散布図として描くので、
+    アーティストの数は針の本数によらない。
+    labels: Trueの場合は各針の識別子を添える
+    """
+    if isinstance(spines, SpineArray):
+        segments = np.stack([np.stack([spines.x1, spines.y1], axis=-1),
+                             np.stack([spines.x2, spines.y2], axis=-1)], axis=1)
+        cx, cy = spines.cx, spines.cy
+    else:
+        segments = np.array([s.coords() for s in spines],
+                            dtype=np.float64).reshape(-1, 2, 2)
+        cx = np.array([s.center.x for s in spines], dtype=np.float64)
+        cy = np.array([s.center.y for s in spines], dtype=np.float64)
+
+    # Spine.plotと同じ見た目になるよう、線幅・点の大きさはplotの既定値に揃える
+    linewidth = matplotlib.rcParams["lines.linewidth"]
+    markersize = matplotlib.rcParams["lines.markersize"]
+    ax.add_collection(matplotlib.collections.LineCollection(
+        segments, colors="black", linewidths=linewidth, zorder=2))
+    ax.scatter(cx, cy, s=markersize**2, marker=".", color="black", zorder=2)
+    if labels:
+        for spine in spines:
+            if spine.identifier is not None:
+                ax.annotate(spine.identifier, xy=(spine.center.x, spine.center.y))
+
+    # 外枠
+    r = matplotlib.patches.Rectangle(xy=(0, 0), width=w, height=h,
+                                     ec='#000000', linestyle=":", fill=False)
+    ax.add_patch(r)
+
+    # 表示範囲
+    rep_spine = spines[0]
+    ax.set_xlim(-rep_spine.l/2, w+rep_spine.l/2)
+    ax.set_ylim(-rep_spine.l/2, h+rep_spine.l/2)
+    return ax
+
+
+class AnimationRecorder(NullRecorder):
+    """
+    記録したフレームをその場で描画し、終了時にアニメーションとして保存する
+    レコーダー。フレームはすべてメモリ上に保持するので、短い実行向け。
+    """
+    def __init__(self, fn, H, W, figsize=(8, 6)):
+        self.H = H
+        self.W = W
+        self.ani = AutoSaveAnimation(fn, figsize=figsize)
+        pass
+
+    def record(self, epoch, spines, energy):
+        ax = self.ani.add_subplot(1, 1, 1, aspect="equal")
+        self.ani.frames.append(spines_plot(self.H, self.W, spines, ax).get_children())
+        return
+
+    def close(self):
+        if self.ani is not None:
+            self.ani.__exit__(None, None, None)
+            self.ani = None
+        return
+
+
+class GifStreamWriter(object):
+    """
+    RGBのフレームを受け取った順にGIFファイルへ書き出す。
+    フレームを保持しないので、フレーム数によらずメモリ使用量は一定。
+    """
+    def __init__(self, fn, interval=100):
+        from PIL import Image
+        self.Image = Image
+        self.interval = interval    # フレーム間隔 [ms]
+        self.file = open(fn, "wb")
+        self.palette = None         # 最初のフレームから作る共通のパレット
+        pass
+
+    def write(self, size, rgb: bytes):
+        from PIL import GifImagePlugin
+        im = self.Image.frombytes("RGB", size, rgb)
+        if self.palette is None:
+            self.palette = im.quantize(colors=256)
+            header, used = GifImagePlugin.getheader(self.palette)
+            header[0] = header[0].replace(b"GIF87a", b"GIF89a")
+            for chunk in header:
+                self.file.write(chunk)
+            # 無限ループの指定
+            self.file.write(b"!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+        frame = im.quantize(palette=self.palette)
+        for chunk in GifImagePlugin.getdata(frame, duration=self.interval):
+            self.file.write(chunk)
+        return
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(b";")
+            self.file.close()
+        return
+
+
+class FFmpegStreamWriter(object):
+    """
+    RGBのフレームをffmpegの標準入力へ流し込み、動画として書き出す。
+    """
+    def __init__(self, fn, interval=100, ffmpeg="ffmpeg"):
+        self.fn = fn
+        self.interval = interval    # フレーム間隔 [ms]
+        self.ffmpeg = ffmpeg
+        self.process = None         # 最初のフレームで大きさが決まってから起動する
+        pass
+
+    def write(self, size, rgb: bytes):
+        if self.process is None:
+            self.process = subprocess.Popen(
+                [self.ffmpeg, "-y", "-loglevel", "error",
+                 "-f", "rawvideo", "-pix_fmt", "rgb24",
+                 "-s", f"{size[0]}x{size[1]}", "-r", f"{1000/self.interval}",
+                 "-i", "-", "-pix_fmt", "yuv420p", self.fn],
+                stdin=subprocess.PIPE)
+        self.process.stdin.write(rgb)
+        return
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed: {self.process.returncode=}")
+            self.process = None
+        return
+
+
+def make_stream_writer(fn, interval=100):
+    """
+    拡張子に応じたストリーミングの書き出し先を返す。
+    .gifはPillow、それ以外（.mp4など）はffmpegで書き出す。
+    """
+    if fn.lower().endswith(".gif"):
+        return GifStreamWriter(fn, interval)
+    return FFmpegStreamWriter(fn, interval)
+
+
+def render_frame(H, W, layout, figsize=(8, 6), dpi=100):
+    """
+    配置layout = (中心x, 中心y, 角度, 長さ) の配列を一枚描画し、
+    (大きさ, RGBのバイト列) を返す。pyplotを使わないのでワーカープロセスでも使える。
+    """
+    fig = matplotlib.figure.Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1, aspect="equal")
+    spines_plot(H, W, SpineArray(*layout), ax)
+    canvas.draw()
+    rgb = np.asarray(canvas.buffer_rgba())[:, :, :3].tobytes()
+    return canvas.get_width_height(), rgb
+
+
+def render_trajectory(path, fn, every=1, figsize=(8, 6), dpi=100, interval=100,
+                      max_workers=None, max_pending=None):
+    """
+    trajectory.TrajectoryRecorderで記録したログからアニメーションを作る。
+
+    フレームはプロセスプールで並列に描画し、完了したものから順番どおりに
+    書き出し先へ流し込む。同時に描画中・待機中のフレームはmax_pending（省略時
+    はワーカー数の2倍）までに抑えるので、メモリ使用量はフレーム数によらない。
+
+    fn: 出力先。.gifの場合はPillow、それ以外はffmpegで書き出す。
+    every: 何フレームごとに描画するか
+    interval: フレーム間隔 [ms]
+    """
+    with open(path, "rb") as f:
+        N, H, W = read_header(f)
+    if max_pending is None:
+        max_pending = 2*(max_workers or os.cpu_count() or 1)
+    writer = make_stream_writer(fn, interval)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = collections.deque()
+            for k, (epoch, energy, spines) in enumerate(read_trajectory(path)):
+                if k % every != 0:
+                    continue
+                if len(pending) >= max_pending:
+                    writer.write(*pending.popleft().result())
+                # ログの読み出しは同じ配列を更新するので複製して渡す
+                layout = (spines.cx.copy(), spines.cy.copy(),
+                          spines.theta.copy(), spines.l.copy())
+                pending.append(executor.submit(render_frame, H, W, layout,
+                                               figsize, dpi))
+            while pending:
+                writer.write(*pending.popleft().result())
+    finally:
+        writer.close()
+    return
+
+
+def render_last(path, fn):
+    """
+    trajectory.TrajectoryRecorderで記録したログの最後のフレームを画像で保存する。
+    """
+    with open(path, "rb") as f:
+        N, H, W = read_header(f)
+    spines = None
+    for epoch, energy, spines in read_trajectory(path):
+        pass
+    if spines is not None:
+        display(H, W, spines, fn=fn)
+    return
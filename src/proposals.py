@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# アニーリングの状態推移（移動の提案）の方法。
+# いずれも propose(H, W, cm, rng) で (動かす針の添字, 新しい中心, 新しい角度) を
+# 返し、採否の結果を feedback(accepted, delta) で受け取る。
+# 一様でない提案は詳細釣り合いを満たさないが、目的はエネルギー０の配置を得る
+# ことなので問題としない。
+import logging
+import math
+
+from geometry import Point
+from general import random_pose
+
+logger = logging.getLogger(__name__)
+
+
+class Proposal(object):
+    """
+    移動の提案方法の基底クラス。提案数と採択数を数える。
+    """
+    name = "base"
+
+    def __init__(self):
+        self.proposed = 0
+        self.accepted = 0
+        self.movable = None         # 動かしてよい針の添字のリスト
+        self.movable_set = None
+        pass
+
+    def prepare(self, movable=None):
+        """
+        動かしてよい針の添字のリストを設定する。Noneの場合はすべての針。
+        """
+        self.movable = movable
+        self.movable_set = None if movable is None else set(movable)
+        return
+
+    def propose(self, H, W, cm, rng):
+        raise NotImplementedError
+
+    def feedback(self, accepted, delta):
+        """
+        提案した移動の採否と、接触ペア数の変化量を受け取る。
+        """
+        self.proposed += 1
+        if accepted:
+            self.accepted += 1
+        return
+
+    @property
+    def acceptance_rate(self):
+        if self.proposed == 0:
+            return 0.0
+        return self.accepted / self.proposed
+
+    def pick(self, cm, rng):
+        """
+        動かしてよい針から一様に一つ選ぶ。
+        """
+        if self.movable is None:
+            return rng.randrange(len(cm.objects))
+        return self.movable[rng.randrange(len(self.movable))]
+
+    def pick_contacted(self, cm, rng, max_tries=8):
+        """
+        接触している針から一様に一つ選ぶ。動かしてよい針に限る場合は選び直し、
+        max_tries回で見つからなければ動かしてよい針から一様に選ぶ。
+        """
+        if len(cm.contacted) == 0:
+            return self.pick(cm, rng)
+        for k in range(max_tries):
+            i = cm.contacted.choice(rng)
+            if self.movable_set is None or i in self.movable_set:
+                return i
+        return self.pick(cm, rng)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.proposed=}, {self.accepted=}>"
+
+
+class UniformProposal(Proposal):
+    """
+    針を一様に選び、領域内に一様に置き直す。
+    """
+    name = "uniform"
+
+    def propose(self, H, W, cm, rng):
+        i = self.pick(cm, rng)
+        center, theta = random_pose(H, W, rng)
+        return i, center, theta
+
+
+class ContactedProposal(Proposal):
+    """
+    接触している針を選び、領域内に一様に置き直す。
+    """
+    name = "contacted"
+
+    def propose(self, H, W, cm, rng):
+        i = self.pick_contacted(cm, rng)
+        center, theta = random_pose(H, W, rng)
+        return i, center, theta
+
+
+class LocalProposal(Proposal):
+    """
+    接触している針を選び、位置・角度を少しだけずらす。
+
+    pos_scale: 位置のずらし幅の上限。針の長さに対する比
+    angle_scale: 角度のずらし幅の上限
+    """
+    name = "local"
+
+    def __init__(self, pos_scale=0.25, angle_scale=0.3):
+        super().__init__()
+        self.pos_scale = pos_scale
+        self.angle_scale = angle_scale
+        pass
+
+    def propose(self, H, W, cm, rng):
+        i = self.pick_contacted(cm, rng)
+        x = cm.objects[i]
+        center = x.center
+        d = self.pos_scale * x.l
+        center = Point(_clip(center.x + rng.uniform(-d, d), 0, W),
+                       _clip(center.y + rng.uniform(-d, d), 0, H))
+        theta = (x.theta + rng.uniform(-self.angle_scale, self.angle_scale)) \
+            % math.pi
+        return i, center, theta
+
+
+class ContactWindowProposal(Proposal):
+    """
+    接触している針を選び、接触箇所の周辺の窓の中に一様に置き直す。
+
+    window: 窓の一辺の長さ。針の長さに対する比
+    """
+    name = "window"
+
+    def __init__(self, window=1.0):
+        super().__init__()
+        self.window = window
+        pass
+
+    def propose(self, H, W, cm, rng):
+        i = self.pick_contacted(cm, rng)
+        x = cm.objects[i]
+        neighbors = sorted(cm.E[i])
+        if neighbors:
+            other = cm.objects[neighbors[rng.randrange(len(neighbors))]]
+            point = x.cross(other)
+            if not isinstance(point, Point):
+                # 平行・同一直線の場合は中心の中点とする
+                point = (x.center + other.center) / 2
+        else:
+            point = x.center
+        d = self.window * x.l / 2
+        center = Point(_clip(point.x + rng.uniform(-d, d), 0, W),
+                       _clip(point.y + rng.uniform(-d, d), 0, H))
+        theta = rng.uniform(0, math.pi)
+        return i, center, theta
+
+
+class AdaptiveMixture(Proposal):
+    """
+    複数の提案方法を確率的に使い分ける。各方法の選ばれやすさは、その方法で
+    接触ペア数が減った割合（指数移動平均）に比例させ、少なくともfloorを
+    方法の数で割った確率では選ばれるようにする。
+
+    strategies: Proposalのリスト
+    decay: 指数移動平均の減衰率
+    """
+    name = "adaptive"
+
+    def __init__(self, strategies, decay=0.99, floor=0.1):
+        super().__init__()
+        self.strategies = list(strategies)
+        self.decay = decay
+        self.floor = floor
+        self.scores = [1.0]*len(self.strategies)
+        self.last = None
+        pass
+
+    def prepare(self, movable=None):
+        super().prepare(movable)
+        for s in self.strategies:
+            s.prepare(movable)
+        return
+
+    @property
+    def weights(self):
+        K = len(self.strategies)
+        total = sum(self.scores)
+        return [self.floor/K + (1-self.floor)*score/total
+                for score in self.scores]
+
+    def propose(self, H, W, cm, rng):
+        r = rng.random()
+        k = 0
+        for k, w in enumerate(self.weights):
+            r -= w
+            if r < 0:
+                break
+        self.last = k
+        return self.strategies[k].propose(H, W, cm, rng)
+
+    def feedback(self, accepted, delta):
+        super().feedback(accepted, delta)
+        k = self.last
+        self.strategies[k].feedback(accepted, delta)
+        reward = -delta if accepted and delta < 0 else 0
+        self.scores[k] = self.decay*self.scores[k] + (1-self.decay)*reward
+        return
+
+    def __repr__(self):
+        rates = {s.name: round(s.acceptance_rate, 3) for s in self.strategies}
+        weights = [round(w, 3) for w in self.weights]
+        return f"<AdaptiveMixture {rates=}, {weights=}>"
+
+
+def _clip(v, lo, hi):
+    return min(max(v, lo), hi)
+
+
+def make_proposal(kind=None, **kwargs):
+    """
+    提案方法を生成する。
+
+    kind: "uniform", "contacted", "local", "window", "adaptive"のいずれか。
+    "adaptive"は前の四つを混合する。Noneの場合はNoneを返す（anealingは従来
+    どおり一様な提案を行う）。
+    """
+    if kind is None:
+        return None
+    elif kind == "uniform":
+        return UniformProposal(**kwargs)
+    elif kind == "contacted":
+        return ContactedProposal(**kwargs)
+    elif kind == "local":
+        return LocalProposal(**kwargs)
+    elif kind == "window":
+        return ContactWindowProposal(**kwargs)
+    elif kind == "adaptive":
+        return AdaptiveMixture([UniformProposal(), ContactedProposal(),
+                                LocalProposal(), ContactWindowProposal()],
+                               **kwargs)
+    raise ValueError(f"unknown proposal: {kind=}")
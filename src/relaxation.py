@@ -1,21 +1,24 @@
 # -*- coding: utf-8 -*-
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 import logging
+import random
+from time import perf_counter
+import numpy as np
 import geometry
 from collections import defaultdict
-from spine import Spine
-from utils import sign, AutoSaveAnimation
-from general import random_spines, display, spines_plot
-from geometry import Point, iSP
+from spine import Spine, SpineArray
+from utils import sign
+from general import random_spines, random_spine_array
+from geometry import Point, Line, iSP, iSP_batch, segment_intersection_batch
 from contact_manager import ContactManager
+from trajectory import NullRecorder
 
 logger = logging.getLogger(__name__)
 
 INF = float("infinity")
 
-def relaxation(H, W, L, N) -> list[Spine]:
+def relaxation(H, W, L, N, spines=None, rng=random, recorder=None,
+               info=None, vectorized=False, stats=None,
+               callback=None, checkpoint=None) -> list[Spine]:
     """自然な接触を考慮することで平衡状態を目指すアプローチで針の位置・向きを求める。
 
     1. 貫入を許してランダムに針を生成
@@ -25,6 +28,23 @@ def relaxation(H, W, L, N) -> list[Spine]:
     問題点：
     - 局所安定に陥った場合に抜け出す手段がない。
     - 収束までに要する時間を見積もる方法がわからない
+
+    spines: 初期配置。Spineのリストまたはspine.SpineArray。Noneの場合はラン
+    ダムに生成する。与えた場合はNは無視され、spinesを直接更新する。
+    rng: random.Randomのインスタンス。省略時はrandomモジュールの乱数を使う。
+    recorder: 生成過程を記録するレコーダー（trajectory.TrajectoryRecorderな
+    ど）。Noneの場合は記録しない。
+    info: dictを与えると、終了時のエネルギー（"energy"）と反復回数（"epochs"）
+    を書き込む。
+    vectorized: Trueの場合、各反復の更新量を接触ペアの配列からまとめて計算す
+    る。配置はSpineArrayとして保持し、それを返す。
+    stats: instrument.Statsを与えると、接触判定の回数と各段階（delta,
+    contact_update, record）の時間を集計する。Noneの場合は集計しない。
+    callback: 各反復の後に callback(epoch, エネルギー, stats) を呼ぶ。Trueを
+    返すとその時点で打ち切る。Noneの場合は呼ばない。
+    checkpoint: checkpoint.Checkpointerを与えると、計算の途中の状態を定期的に
+    保存する。反復回数の上限で終えた場合も保存する。checkpoint.resumeで再開
+    でき、中断しなかった場合と同じ結果になる。
     """
     # 更新量を制御するグローバルパラメータ
     pos_epsilon = 0.1
@@ -33,23 +53,78 @@ def relaxation(H, W, L, N) -> list[Spine]:
     max_iteration = 50
 
     # ランダムな生成
-    spines = random_spines(H, W, L, N)
-    cm = ContactManager()
-    for spine in spines:
-        cm.register(spine)
+    if spines is None:
+        if vectorized:
+            spines = random_spine_array(H, W, L, N, rng)
+        else:
+            spines = random_spines(H, W, L, N, rng)
+    elif vectorized and not isinstance(spines, SpineArray):
+        spines = SpineArray.from_spines(spines)
+    if recorder is None:
+        recorder = NullRecorder()
+    cm = ContactManager.from_spines(spines, index="grid", cell_size=L,
+                                    stats=stats)
+
+    recorder.record(0, spines, cm.num_contact_pairs)
 
-    with AutoSaveAnimation("relaxation.gif", figsize=(8, 6)) as ani:
-        cp = list(cm.contact_pairs())
+    state = {
+        "solver": "relaxation",
+        "spines": spines, "cm": cm, "epoch": 0, "vectorized": vectorized,
+        "pos_epsilon": pos_epsilon, "angle_epsilon": angle_epsilon,
+        "max_iteration": max_iteration,
+    }
+    return _run(state, recorder, info, stats, callback, checkpoint)
 
-        ax = ani.add_subplot(1, 1, 1, aspect="equal")
-        ani.frames.append(spines_plot(H, W, spines, ax).get_children())
 
-        for epoch in range(max_iteration):
+def resume_relaxation(state: dict, recorder=None, info=None, stats=None,
+                      callback=None, checkpoint=None, max_iteration=None):
+    """
+    checkpoint.load_checkpointで読み込んだ状態からrelaxationを再開する。
+    引数はrelaxationと同じ。max_iterationを与えると反復回数の上限を変更する。
+    """
+    if max_iteration is not None:
+        state["max_iteration"] = max_iteration
+    state["cm"].stats = stats
+    if recorder is None:
+        recorder = NullRecorder()
+    recorder.record(state["epoch"], state["spines"],
+                    state["cm"].num_contact_pairs)
+    return _run(state, recorder, info, stats, callback, checkpoint)
+
+
+def _run(state, recorder, info, stats, callback, checkpoint):
+    """
+    relaxationの反復。stateの内容から始め、終了後の配置を返す。
+    """
+    spines = state["spines"]
+    cm = state["cm"]
+    epoch = state["epoch"]
+    vectorized = state["vectorized"]
+    pos_epsilon = state["pos_epsilon"]
+    angle_epsilon = state["angle_epsilon"]
+    max_iteration = state["max_iteration"]
+
+    debug = logger.isEnabledFor(logging.DEBUG)
+    while epoch < max_iteration:
+        if checkpoint is not None and checkpoint.due(epoch):
+            state["epoch"] = epoch
+            checkpoint.save(state)
+
+        if debug:
             logger.debug(f"{epoch=}/{max_iteration}")
 
-            if len(cp) == 0:
-                logger.debug("iteration end")
-                break
+        if cm.num_contact_pairs == 0:
+            logger.debug("iteration end")
+            break
+
+        if stats is not None:
+            start = perf_counter()
+        if vectorized:
+            touched = vectorized_update(spines, cm.contact_edges(),
+                                        pos_epsilon, angle_epsilon)
+            updated = [cm.objects[i] for i in touched]
+        else:
+            cp = list(cm.contact_pairs())
 
             # obj1, obj2の重なりによる更新量を求める
             deltas_dict = defaultdict(lambda: Spine(Point(0, 0), 0, 0))
@@ -58,22 +133,47 @@ def relaxation(H, W, L, N) -> list[Spine]:
                 for key, val in update.items():
                     deltas_dict[key] += val
 
-            if logger.level == logging.DEBUG:
+            if debug:
                 for key, value in deltas_dict.items():
                     logger.debug(f"update {key.identifier=}, {value=}")
 
             # 更新量にしたがって更新する。
             apply_update(deltas_dict, pos_epsilon, angle_epsilon)
+            updated = list(deltas_dict)
+        if stats is not None:
+            stats.add_time("delta", perf_counter() - start)
+            start = perf_counter()
 
-            # 描画
-            ax = ani.add_subplot(1, 1, 1, aspect="equal")
-            ani.frames.append(spines_plot(H, W, spines, ax).get_children())
-
-            # 接触情報を更新
-            for spine in deltas_dict:
+        # 接触情報を更新
+        if vectorized:
+            cm.update_many(updated)
+        else:
+            for spine in updated:
                 cm.update(spine)
-            cp = list(cm.contact_pairs())
+        if stats is not None:
+            stats.add_time("contact_update", perf_counter() - start)
+            start = perf_counter()
+
+        # 記録
+        for spine in updated:
+            recorder.mark(cm.mapping[spine])
+        recorder.record(epoch+1, spines, cm.num_contact_pairs)
+        if stats is not None:
+            stats.add_time("record", perf_counter() - start)
+
+        epoch += 1
+        if callback is not None and \
+           callback(epoch, cm.num_contact_pairs, stats):
+            break
+    else:
+        # 反復回数の上限で終えた場合は、延長できるように保存しておく
+        if checkpoint is not None:
+            state["epoch"] = epoch
+            checkpoint.save(state)
 
+    if info is not None:
+        info["energy"] = cm.num_contact_pairs
+        info["epochs"] = epoch
     return spines
 
 
@@ -89,7 +189,6 @@ def calc_delta(obj1: Spine, obj2: Spine):
     # 角度
     # 交点を求める
     cross_point = obj1.cross(obj2)
-    logger.debug(f"{type(cross_point)} {Point}")
     if (type(cross_point) is not Point):
         # 交差する２点を入力しているはずである。警告し更新なしとする。
         logger.warning(f"needless update ({obj1=}, {obj2=})")
@@ -112,11 +211,61 @@ def calc_delta(obj1: Spine, obj2: Spine):
     delta_pos2 = obj2.center-obj1.center
     # 位置が完全に一致した場合はどうにかすべきだがめったにない
 
-    logger.debug(f"{delta_theta1=}, {delta_theta2=}")
+    logger.debug("delta_theta1=%s, delta_theta2=%s", delta_theta1, delta_theta2)
     update[obj1] = Spine(delta_pos1, delta_theta1, l=0)
     update[obj2] = Spine(delta_pos2, delta_theta2, l=0)
     return update
 
+def vectorized_update(spines: SpineArray, edges, pos_epsilon, angle_epsilon):
+    """
+    calc_deltaとapply_updateの配列版。接触しているペアの添字の配列edgesから、
+    すべての針の更新量をまとめて求めてspinesを更新する。
+
+    更新した針の添字の配列を返す。
+    """
+    I, J = edges[:, 0], edges[:, 1]
+    s1 = np.stack([spines.x1[I], spines.y1[I], spines.x2[I], spines.y2[I]], axis=-1)
+    s2 = np.stack([spines.x1[J], spines.y1[J], spines.x2[J], spines.y2[J]], axis=-1)
+
+    # 交点を求める。交差しないペア（平行・同一直線）は更新なしとする。
+    overlap, relation, cross_points = segment_intersection_batch(s1, s2)
+    valid = relation == Line._CROSS
+    if not np.all(valid):
+        logger.warning(f"needless update ({np.count_nonzero(~valid)} pairs)")
+    I, J, cross_points = I[valid], J[valid], cross_points[valid]
+
+    # 角度。交点位置から回転方向を決める。
+    status = iSP_batch(spines.cx[I], spines.cy[I],
+                       cross_points[:, 0], cross_points[:, 1],
+                       spines.cx[J], spines.cy[J])
+    delta_theta1 = np.where(status == 1, -1.0, np.where(status == -1, 1.0, 0.0))
+
+    # 位置。互いに遠ざかる方向。
+    delta_x = spines.cx[I] - spines.cx[J]
+    delta_y = spines.cy[I] - spines.cy[J]
+
+    N = len(spines)
+    sum_x = np.zeros(N)
+    sum_y = np.zeros(N)
+    sum_theta = np.zeros(N)
+    np.add.at(sum_x, I, delta_x)
+    np.add.at(sum_x, J, -delta_x)
+    np.add.at(sum_y, I, delta_y)
+    np.add.at(sum_y, J, -delta_y)
+    np.add.at(sum_theta, I, delta_theta1)
+    np.add.at(sum_theta, J, -delta_theta1)
+
+    # 方向だけ取り出して更新する。領域外に飛び出すことは気にしない
+    touched = np.unique(np.concatenate([I, J]))
+    norm = np.hypot(sum_x[touched], sum_y[touched])
+    # 位置が完全に一致した場合は位置を更新しない
+    scale = np.divide(pos_epsilon, norm, out=np.zeros_like(norm), where=norm > 0)
+    spines.update_many(touched,
+                       spines.cx[touched] + sum_x[touched]*scale,
+                       spines.cy[touched] + sum_y[touched]*scale,
+                       spines.theta[touched] + np.sign(sum_theta[touched])*angle_epsilon)
+    return touched
+
 def apply_update(update: dict, pos_epsilon, angle_epsilon):
     """
     updateはSpineオブジェクトをキーとして、更新量・方向をSpine型で記述したものを値としているdict
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+
+from spine import Spine
+from general import random_pose
+from contact_manager import ContactManager
+from anealing import anealing
+from trajectory import NullRecorder
+
+logger = logging.getLogger(__name__)
+
+
+def random_sequential_adsorption(H, W, L, N, max_attempts=100, rng=random,
+                                 recorder=None, info=None, stats=None,
+                                 callback=None) -> list[Spine]:
+    """ランダム逐次吸着（RSA）によって針の位置・向きを求める。
+
+    1. 針を一本ずつランダムに置き、既に置いた針と重なる場合は置き直す
+    2. max_attempts回置き直しても重なる針は、最後の候補の位置に置いておく
+    3. 置けなかった針がある場合は、それらの針のみを動かすアニーリングに引き継ぐ
+
+    疎から中程度の密度では、ほとんどの針が手順１で置けるため、全体をアニー
+    リングするよりもはるかに速い。
+
+    rng: random.Randomのインスタンス。省略時はrandomモジュールの乱数を使う。
+    recorder: アニーリングの生成過程を記録するレコーダー。Noneの場合は記録しない。
+    info: dictを与えると、終了時のエネルギー（"energy"）、アニーリングの反復回
+    数（"epochs"）、手順１で置けた針の数（"placed"）を書き込む。
+    stats, callback: 手順１の接触判定の集計と、アニーリングに渡す計測・コール
+    バック。anealingを参照。
+
+    置けた針、置けなかった針の順に並べたSpineのリストを返す。
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1: {max_attempts=}")
+    cm = ContactManager(index="grid", cell_size=L, stats=stats)
+    placed = []
+    failed = []
+    for k in range(N):
+        for attempt in range(max_attempts):
+            center, theta = random_pose(H, W, rng)
+            spine = Spine(center, theta, L, identifier=f"{k}")
+            if not cm.overlapped_objects_with_new(spine):
+                cm.register(spine)
+                placed.append(spine)
+                break
+        else:
+            failed.append(spine)
+    logger.debug("rsa placed %d/%d", len(placed), N)
+
+    spines = placed + failed
+    if recorder is None:
+        recorder = NullRecorder()
+    if not failed:
+        # アニーリングを行わない場合も手順１の結果を記録する（行う場合は
+        # anealingが同じ配置を最初のフレームとして記録する）
+        recorder.record(0, spines, 0)
+    if info is not None:
+        info["placed"] = len(placed)
+        info["energy"] = 0
+        info["epochs"] = 0
+    if failed:
+        # 置けなかった針のみをアニーリングで動かす
+        spines = anealing(H, W, L, N, spines=spines, rng=rng,
+                          recorder=recorder, info=info,
+                          movable=range(len(placed), N), stats=stats,
+                          callback=callback)
+    return spines
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# アニーリングの温度スケジュール。
+# 反復回数または経過時間（time_budget）で終了を決め、停滞を検出した場合は
+# 打ち切るか再加熱する。
+import logging
+import math
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class PlateauDetector(object):
+    """
+    エネルギーの停滞を検出する。最良のエネルギーがpatience回の更新の間
+    min_delta以上改善しなければ停滞とみなす。
+    """
+    def __init__(self, patience=500, min_delta=1):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = None
+        self.since = 0          # 最後に改善してからの更新回数
+        pass
+
+    def update(self, e):
+        """
+        エネルギーeを受け取り、停滞している場合はTrueを返す。
+        停滞を報告すると数え直す。
+        """
+        if self.best is None or e <= self.best - self.min_delta:
+            self.best = e
+            self.since = 0
+            return False
+        self.since += 1
+        if self.since >= self.patience:
+            self.since = 0
+            return True
+        return False
+
+
+class Schedule(object):
+    """
+    温度スケジュールの基底クラス。
+
+    max_iteration: 反復回数の上限。time_budgetを与えた場合はNoneにできる。
+    time_budget: 経過時間の上限（秒）。与えた場合は進み具合を経過時間で測る。
+    plateau: PlateauDetector。Noneの場合は停滞を検出しない。
+    on_plateau: 停滞したときの動作。"stop"は打ち切り、"reheat"は再加熱する。
+    max_reheats: 再加熱の回数の上限。超えた後の停滞では打ち切る。
+    warmup: 停滞の検出を始める進み具合。温度が高いうちはエネルギーが下がら
+    ないのが普通なので、それを停滞とみなさないようにする。
+    """
+    def __init__(self, max_iteration=3000, time_budget=None, plateau=None,
+                 on_plateau="stop", max_reheats=5, warmup=0.5):
+        if max_iteration is None and time_budget is None:
+            raise ValueError("either max_iteration or time_budget is required")
+        if on_plateau not in ("stop", "reheat"):
+            raise ValueError(f"unknown on_plateau: {on_plateau=}")
+        self.max_iteration = max_iteration
+        self.time_budget = time_budget
+        self.plateau = plateau
+        self.on_plateau = on_plateau
+        self.max_reheats = max_reheats
+        self.warmup = warmup
+        self.reheats = 0
+        self.stopped = False
+        self.start_time = None
+        self.elapsed_before = 0.0   # 中断する前までの経過時間
+        pass
+
+    def start(self):
+        """
+        反復を始める直前に呼ぶ。経過時間の計測を始める。
+        """
+        self.start_time = perf_counter()
+        return
+
+    def elapsed(self):
+        return self.elapsed_before + perf_counter() - self.start_time
+
+    def progress(self, epoch):
+        """
+        進み具合を0から1で返す。time_budgetを与えた場合は経過時間で測る。
+        """
+        if self.time_budget is not None:
+            return min(1.0, self.elapsed() / self.time_budget)
+        return epoch / self.max_iteration
+
+    def done(self, epoch):
+        """
+        反復を終えるべきか。
+        """
+        if self.stopped:
+            return True
+        if self.max_iteration is not None and epoch >= self.max_iteration:
+            return True
+        return self.time_budget is not None and \
+            self.elapsed() >= self.time_budget
+
+    def temperature(self, epoch):
+        raise NotImplementedError
+
+    def feedback(self, accepted, delta):
+        """
+        提案した移動の採否と、エネルギーの変化量を受け取る。
+        """
+        return
+
+    def update(self, epoch, e):
+        """
+        一回の反復を終えた後のエネルギーeを受け取り、停滞を検出する。
+        """
+        if self.plateau is None or self.progress(epoch) < self.warmup:
+            return
+        if self.plateau.update(e):
+            if self.on_plateau == "reheat" and self.reheats < self.max_reheats:
+                self.reheats += 1
+                logger.debug("reheat at epoch %d (e=%s)", epoch, e)
+                self.reheat(epoch)
+            else:
+                logger.debug("plateau at epoch %d (e=%s)", epoch, e)
+                self.stopped = True
+        return
+
+    def reheat(self, epoch):
+        raise NotImplementedError
+
+    def __getstate__(self):
+        # 中断・再開しても経過時間が引き継がれるよう、それまでの経過時間を保存する
+        state = self.__dict__.copy()
+        if self.start_time is not None:
+            state["elapsed_before"] = self.elapsed()
+            state["start_time"] = None
+        return state
+
+
+class GeometricSchedule(Schedule):
+    """
+    t0 * alpha**r で下がる温度。rは進み具合。
+    再加熱では、進み具合をreheatの割合だけ巻き戻した温度に上げる。
+    """
+    def __init__(self, max_iteration=3000, alpha=0.1, t0=1.0, reheat=0.5,
+                 **kwargs):
+        super().__init__(max_iteration, **kwargs)
+        self.alpha = alpha
+        self.t0 = t0
+        self.reheat_ratio = reheat
+        self.offset = 0.0       # 再加熱で巻き戻した進み具合
+        pass
+
+    def temperature(self, epoch):
+        return self.t0 * pow(self.alpha, self.progress(epoch) - self.offset)
+
+    def reheat(self, epoch):
+        r = self.progress(epoch)
+        self.offset += self.reheat_ratio * (r - self.offset)
+        return
+
+
+class AdaptiveSchedule(Schedule):
+    """
+    エネルギーが増える提案の採択率を目標値に近づけるように温度を調整する。
+    目標値は進み具合に応じてtarget_startからtarget_endへ等比に下げる。
+    エネルギーが増える提案のたびに、採択すれば温度を下げ、棄却すれば上げる
+    （対数温度の確率近似）。採択率が目標値に等しいときに釣り合う。
+    温度はt_minからt_maxに収める。再加熱では温度をreheat倍にする。
+    """
+    def __init__(self, max_iteration=3000, target_start=0.3, target_end=1.0e-4,
+                 t0=1.0, gain=0.05, t_min=1.0e-3, t_max=10.0, reheat=10.0,
+                 **kwargs):
+        super().__init__(max_iteration, **kwargs)
+        self.target_start = target_start
+        self.target_end = target_end
+        self.t = t0
+        self.gain = gain
+        self.t_min = t_min
+        self.t_max = t_max
+        self.reheat_ratio = reheat
+        self.epoch = 0              # 最後に温度を求めた反復
+        pass
+
+    def target(self, epoch):
+        r = self.progress(epoch)
+        return self.target_start * pow(self.target_end/self.target_start, r)
+
+    def temperature(self, epoch):
+        self.epoch = epoch
+        return self.t
+
+    def feedback(self, accepted, delta):
+        if delta > 0:
+            error = (1 if accepted else 0) - self.target(self.epoch)
+            self.t = min(self.t_max,
+                         max(self.t_min, self.t * math.exp(-self.gain*error)))
+        return
+
+    def reheat(self, epoch):
+        self.t = min(self.t_max, self.t * self.reheat_ratio)
+        return
+
+
+def make_schedule(kind=None, **kwargs):
+    """
+    温度スケジュールを生成する。
+
+    kind: "geometric", "adaptive", "reheat"のいずれか。"reheat"は停滞時に再加
+    熱するgeometric。Noneの場合は"geometric"。
+    """
+    if kind is None or kind == "geometric":
+        return GeometricSchedule(**kwargs)
+    elif kind == "adaptive":
+        return AdaptiveSchedule(**kwargs)
+    elif kind == "reheat":
+        kwargs.setdefault("plateau", PlateauDetector())
+        kwargs.setdefault("on_plateau", "reheat")
+        return GeometricSchedule(**kwargs)
+    raise ValueError(f"unknown schedule: {kind=}")
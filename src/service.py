@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+# 配置を生成するHTTP/JSONサービス。
+#
+# 例: python service.py --port 8080 --workers 4 --cache-dir cache
+#     curl -d '{"H": 10, "W": 10, "L": 3, "N": 60, "engine": "anealing",
+#               "seed": 0}' http://127.0.0.1:8080/layout
+#
+# POST /layout  パラメータのJSONを受け取り、batch.run_oneの結果を返す
+# GET /stats    キャッシュの命中数、実行中の数などを返す
+#
+# 生成はプロセスプールで行い、同時に実行する数（待ちを含む）がmax_pendingに
+# 達していれば503を返す（バックプレッシャー）。一つの生成にかかる時間は、針の
+# 本数の上限max_nと、反復を打ち切る時間time_budgetで抑える。実行中と同じパラ
+# メータの要求は新たに実行せず、その結果を待つ。完了した結果は、パラメータと
+# コードの版から求めたハッシュをキーとしてディスクにキャッシュする。
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from batch import ENGINES, run_one
+
+logger = logging.getLogger(__name__)
+
+# 要求の本体の大きさの上限（バイト）
+MAX_BODY = 1 << 16
+# 針の長さの下限。接触判定の許容誤差（geometry.EPS）に比べて短い針は、バウン
+# ディングボックスの余白が針よりはるかに大きくなり、計算が進まない。
+MIN_L = 1.0e-3
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Busy(Exception):
+    pass
+
+
+def code_version(directory=None):
+    """
+    directory（省略時はこのファイルのディレクトリ）の*.pyの内容から求めたハッ
+    シュ。コードを変更するとキャッシュのキーが変わる。
+    """
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        h.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def normalize(params: dict, max_n=None) -> dict:
+    """
+    要求のパラメータを検査し、既定値を補ったdictを返す。不正な場合はBadRequest。
+    H, W, Lは正の有限な数（LはMIN_L以上）、Nは０以上max_n以下の整数（max_nが
+    Noneの場合は上限なし）、
+    seedは整数（省略時は0）、engineはbatch.ENGINESのいずれか（省略時は
+    "anealing"）。
+    """
+    if not isinstance(params, dict):
+        raise BadRequest("request must be a JSON object")
+    unknown = set(params) - {"H", "W", "L", "N", "engine", "seed"}
+    if unknown:
+        raise BadRequest(f"unknown parameters: {sorted(unknown)}")
+    ret = {}
+    for name in ("H", "W", "L"):
+        v = params.get(name)
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or \
+                not math.isfinite(v) or not v > 0:
+            raise BadRequest(f"{name} must be a positive finite number")
+        ret[name] = float(v)
+    if ret["L"] < MIN_L:
+        raise BadRequest(f"L must be at least {MIN_L}")
+    for name, default in (("N", None), ("seed", 0)):
+        v = params.get(name, default)
+        if isinstance(v, bool) or not isinstance(v, int) or v < 0:
+            raise BadRequest(f"{name} must be a non-negative integer")
+        ret[name] = v
+    if max_n is not None and ret["N"] > max_n:
+        raise BadRequest(f"N must be at most {max_n}")
+    engine = params.get("engine", "anealing")
+    if engine not in ENGINES:
+        raise BadRequest(f"engine must be one of {sorted(ENGINES)}")
+    ret["engine"] = engine
+    return ret
+
+
+def cache_key(params: dict, version: str) -> str:
+    """
+    正規化したパラメータとコードの版から求めたキャッシュのキー。
+    """
+    text = json.dumps(params, sort_keys=True) + version
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache(object):
+    """
+    結果のJSONをキーごとのファイルとしてディスクに保存するキャッシュ。
+    max_entriesを超えると最も古く参照されたものから削除する（LRU）。
+    参照順はファイルの更新時刻として記録するので、再起動後も引き継がれる。
+    """
+    def __init__(self, directory, max_entries=1000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        paths = glob.glob(os.path.join(directory, "*.json"))
+        paths.sort(key=os.path.getmtime)
+        # キャッシュしたキーを参照順に並べたもの。末尾ほど最近参照した
+        self.entries = OrderedDict()
+        for path in paths:
+            self.entries[os.path.basename(path)[:-len(".json")]] = None
+        self._evict()
+        pass
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """
+        キャッシュした本体のバイト列を返す。なければNone。
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                body = f.read()
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body: bytes):
+        """
+        本体を保存する。一時ファイルに書き出してから置き換える。
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".cache-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        self._evict()
+        return
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            key, _ = self.entries.popitem(last=False)
+            try:
+                os.unlink(self.path(key))
+            except FileNotFoundError:
+                pass
+        return
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class LayoutService(object):
+    """
+    要求を受けて配置を生成する。キャッシュ、実行中の要求の合流、プロセスプー
+    ルでの実行を受け持つ。
+
+    max_workers: プロセスプールのワーカー数
+    max_pending: 同時に実行する（待ちを含む）生成の上限。超えた要求はBusy。
+    省略時はワーカー数の2倍。
+    cache: ResultCache。Noneの場合はキャッシュしない。
+    max_n: 針の本数の上限。超えた要求はBadRequest。Noneの場合は上限なし。
+    time_budget: 一つの生成の反復を打ち切る時間（秒）。打ち切った結果は返す
+    がキャッシュしない。Noneの場合は打ち切らない。
+    """
+    def __init__(self, max_workers=None, max_pending=None, cache=None,
+                 version=None, max_n=10000, time_budget=60.0):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2*self.max_workers
+        self.cache = cache
+        self.max_n = max_n
+        self.time_budget = time_budget
+        self.version = code_version() if version is None else version
+        # ワーカーは最初の要求の処理中に起動されるので、forkで起動すると待ち受
+        # け中のソケットや接続中のソケットを引き継ぎ、closeしても接続が閉じら
+        # れなくなる。ソケットを引き継がない方法で起動する。
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=_mp_context())
+        self.inflight = {}      # キーから実行中の生成のFutureを得るマッピング
+        self.counts = {"requests": 0, "computed": 0, "coalesced": 0,
+                       "rejected": 0, "errors": 0, "timed_out": 0}
+        pass
+
+    async def layout(self, params: dict):
+        """
+        パラメータparamsの配置を返す。
+        戻り値は (結果のJSONのバイト列, "hit", "coalesced", "miss"のいずれか)。
+        """
+        self.counts["requests"] += 1
+        params = normalize(params, self.max_n)
+        key = cache_key(params, self.version)
+        if self.cache is not None:
+            body = self.cache.get(key)
+            if body is not None:
+                return body, "hit"
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.counts["coalesced"] += 1
+            # 一つの要求が切断されても、合流した他の要求の実行は取り消さない
+            return await asyncio.shield(future), "coalesced"
+
+        if len(self.inflight) >= self.max_pending:
+            self.counts["rejected"] += 1
+            raise Busy(f"{len(self.inflight)} layouts in progress")
+
+        future = asyncio.ensure_future(self._compute(key, params))
+        self.inflight[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(future), "miss"
+
+    def _done(self, key, future):
+        self.inflight.pop(key, None)
+        # 要求がすべて切断された場合も、例外を取り出しておく
+        if not future.cancelled():
+            future.exception()
+        return
+
+    async def _compute(self, key, params):
+        loop = asyncio.get_running_loop()
+        try:
+            record = await loop.run_in_executor(
+                self.executor, run_one, params["engine"], params["H"],
+                params["W"], params["L"], params["N"], params["seed"],
+                self.time_budget)
+        except Exception:
+            self.counts["errors"] += 1
+            raise
+        self.counts["computed"] += 1
+        body = json.dumps(record).encode()
+        if record["timed_out"]:
+            # 実行速度に依存する結果なのでキャッシュしない
+            self.counts["timed_out"] += 1
+        elif self.cache is not None:
+            self.cache.put(key, body)
+        return body
+
+    def stats(self):
+        ret = dict(self.counts)
+        ret["inflight"] = len(self.inflight)
+        ret["max_pending"] = self.max_pending
+        ret["workers"] = self.max_workers
+        ret["max_n"] = self.max_n
+        ret["time_budget"] = self.time_budget
+        ret["version"] = self.version
+        if self.cache is not None:
+            ret["cache_entries"] = len(self.cache)
+            ret["cache_hits"] = self.cache.hits
+            ret["cache_misses"] = self.cache.misses
+        return ret
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn")
+
+
+async def handle(service: LayoutService, reader, writer):
+    """
+    一つの接続の要求を順に処理する（HTTP/1.1、keep-alive）。
+    """
+    try:
+        while True:
+            request = await _read_request(reader)
+            if request is None:
+                break
+            method, path, headers, body = request
+            start = perf_counter()
+            status, payload, extra = await _dispatch(service, method, path,
+                                                     body)
+            keep_alive = headers.get("connection", "").lower() != "close"
+            _write_response(writer, status, payload, extra, keep_alive)
+            await writer.drain()
+            logger.debug("%s %s %d %.1f ms", method, path, status,
+                         1000*(perf_counter() - start))
+            if not keep_alive:
+                break
+    except BadRequest as e:
+        _write_response(writer, 400, _error(str(e)), {}, False)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+    return
+
+
+async def _dispatch(service, method, path, body):
+    """
+    要求を処理し、(ステータス, 本体のバイト列, 追加のヘッダ) を返す。
+    """
+    if path == "/stats":
+        if method != "GET":
+            return 405, _error("use GET"), {}
+        return 200, json.dumps(service.stats()).encode(), {}
+    if path != "/layout":
+        return 404, _error(f"unknown path: {path}"), {}
+    if method != "POST":
+        return 405, _error("use POST"), {}
+    try:
+        params = json.loads(body)
+        payload, source = await service.layout(params)
+    except (BadRequest, ValueError) as e:
+        return 400, _error(str(e)), {}
+    except Busy as e:
+        return 503, _error(str(e)), {"Retry-After": "1"}
+    except Exception as e:
+        logger.exception("layout failed")
+        return 500, _error(f"{type(e).__name__}: {e}"), {}
+    return 200, payload, {"X-Cache": source}
+
+
+async def _read_request(reader):
+    """
+    要求を一つ読み、(メソッド, パス, ヘッダ, 本体) を返す。接続が閉じられた
+    場合はNone。
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, version = line.decode("latin-1").split()
+    except ValueError:
+        raise BadRequest("malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest("invalid Content-Length")
+    if not 0 <= length <= MAX_BODY:
+        raise BadRequest(f"body must be at most {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?")[0], headers, body
+
+
+def _write_response(writer, status, payload, extra, keep_alive):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+             "Content-Type: application/json",
+             f"Content-Length: {len(payload)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{k}: {v}" for k, v in extra.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+    return
+
+
+def _error(message):
+    return json.dumps({"error": message}).encode()
+
+
+async def serve(host="127.0.0.1", port=8080, max_workers=None,
+                max_pending=None, cache_dir=None, cache_size=1000,
+                max_n=10000, time_budget=60.0):
+    """
+    サービスを起動し、停止されるまで要求を処理する。
+    """
+    cache = None if cache_dir is None else ResultCache(cache_dir, cache_size)
+    service = LayoutService(max_workers, max_pending, cache, max_n=max_n,
+                            time_budget=time_budget)
+    server = await asyncio.start_server(
+        lambda r, w: handle(service, r, w), host, port)
+    logger.info("serving on %s:%s (workers=%d, max_pending=%d)", host, port,
+                service.max_workers, service.max_pending)
+    # SIGTERMでもワーカーを終了させてから止まるようにする
+    task = asyncio.ensure_future(server.serve_forever())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        async with server:
+            await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        service.close()
+    return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="針の配置を生成するHTTP/JSONサービス。")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="同時に実行する生成の上限。超えた要求には503を返す")
+    parser.add_argument("--cache-dir", default=None,
+                        help="結果をキャッシュするディレクトリ。省略時はキャッシュしない")
+    parser.add_argument("--cache-size", type=int, default=1000,
+                        help="キャッシュする結果の数の上限")
+    parser.add_argument("--max-n", type=int, default=10000,
+                        help="針の本数の上限。超えた要求には400を返す")
+    parser.add_argument("--time-budget", type=float, default=60.0,
+                        help="一つの生成の反復を打ち切る時間（秒）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers,
+                          args.max_pending, args.cache_dir, args.cache_size,
+                          args.max_n, args.time_budget))
+    except KeyboardInterrupt:
+        pass
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# 接触判定の前段（ブロードフェーズ）に用いる空間インデックス
+# いずれもオブジェクトを整数の添字とバウンディングボックスで管理する。
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def bbox_intersects(a, b):
+    """
+    二つのバウンディングボックス (xmin, ymin, xmax, ymax) が重なるか判定する。
+    """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class ListIndex(object):
+    """
+    全オブジェクトを候補として返すインデックス。
+    空間分割を行わない従来の総当たりと等価。
+    """
+    def __init__(self):
+        self.bboxes = {}        # 添字からバウンディングボックスを得るマッピング
+        pass
+
+    def insert(self, i, bbox):
+        self.bboxes[i] = bbox
+        return
+
+    def remove(self, i):
+        del self.bboxes[i]
+        return
+
+    def update(self, i, bbox):
+        self.bboxes[i] = bbox
+        return
+
+    def query(self, bbox):
+        """
+        bboxと重なる可能性のあるオブジェクトの添字を返す。O(N)。
+        """
+        return [i for i, b in self.bboxes.items() if bbox_intersects(bbox, b)]
+
+    def __len__(self):
+        return len(self.bboxes)
+
+
+class GridIndex(object):
+    """
+    一様格子によるインデックス。
+    セルの大きさを針の長さ程度にとると、一つの針が占めるセルは高々数個で、
+    問い合わせのコストは局所的な密度のみに依存する。
+
+    max_span: 一つのオブジェクトを登録するセルの数（一辺あたり）の上限。これを
+    超える大きなオブジェクトはセルに登録せず、すべての問い合わせで候補とする。
+    セルに比べて非常に大きなバウンディングボックスで、登録や問い合わせのコス
+    トが膨らまないようにする。
+    """
+    def __init__(self, cell_size, max_span=8):
+        if cell_size <= 0:
+            raise ValueError(f"cell_size must be positive: {cell_size=}")
+        self.cell_size = cell_size
+        self.max_span = max_span
+        self.cells = {}         # セル座標から添字の集合を得るマッピング
+        self.bboxes = {}        # 添字からバウンディングボックスを得るマッピング
+        self.ranges = {}        # 添字から占有するセルの範囲を得るマッピング
+        self.large = set()      # セルに登録しない大きなオブジェクトの添字
+        pass
+
+    def _cell_range(self, bbox):
+        """
+        bboxが占めるセルの範囲。max_spanを超える場合はNone。
+        """
+        s = self.cell_size
+        r = (math.floor(bbox[0]/s), math.floor(bbox[1]/s),
+             math.floor(bbox[2]/s), math.floor(bbox[3]/s))
+        if r[2] - r[0] >= self.max_span or r[3] - r[1] >= self.max_span:
+            return None
+        return r
+
+    def _cells(self, r):
+        for cx in range(r[0], r[2]+1):
+            for cy in range(r[1], r[3]+1):
+                yield (cx, cy)
+
+    def insert(self, i, bbox):
+        r = self._cell_range(bbox)
+        self.bboxes[i] = bbox
+        self.ranges[i] = r
+        if r is None:
+            self.large.add(i)
+            return
+        for c in self._cells(r):
+            cell = self.cells.get(c)
+            if cell is None:
+                self.cells[c] = {i}
+            else:
+                cell.add(i)
+        return
+
+    def remove(self, i):
+        r = self.ranges.pop(i)
+        del self.bboxes[i]
+        if r is None:
+            self.large.discard(i)
+            return
+        for c in self._cells(r):
+            cell = self.cells[c]
+            cell.discard(i)
+            if not cell:
+                del self.cells[c]
+        return
+
+    def update(self, i, bbox):
+        if self._cell_range(bbox) == self.ranges[i]:
+            # 占有セルが変わらなければバウンディングボックスのみ更新する
+            self.bboxes[i] = bbox
+            return
+        self.remove(i)
+        self.insert(i, bbox)
+        return
+
+    def query(self, bbox):
+        """
+        bboxと重なる可能性のあるオブジェクトの添字を返す。
+        """
+        bboxes = self.bboxes
+        r = self._cell_range(bbox)
+        if r is None:
+            # セルをたどるより総当たりのほうが安い
+            return [i for i, b in bboxes.items() if bbox_intersects(bbox, b)]
+        found = set(self.large)
+        for c in self._cells(r):
+            cell = self.cells.get(c)
+            if cell is not None:
+                found.update(cell)
+        return [i for i in found if bbox_intersects(bbox, bboxes[i])]
+
+    def __len__(self):
+        return len(self.bboxes)
+
+
+class _QuadNode(object):
+    __slots__ = ("bounds", "depth", "items", "children")
+
+    def __init__(self, bounds, depth):
+        self.bounds = bounds
+        self.depth = depth
+        self.items = set()      # このノードに直接属する添字
+        self.children = None    # 分割後は4つの子ノード
+
+
+class QuadTreeIndex(object):
+    """
+    四分木によるインデックス。
+    各オブジェクトはバウンディングボックスを完全に含む最も深いノードに属する。
+    領域外にはみ出したオブジェクトは根に属する。
+    """
+    def __init__(self, bounds, capacity=8, max_depth=12):
+        self.root = _QuadNode(tuple(bounds), 0)
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.bboxes = {}        # 添字からバウンディングボックスを得るマッピング
+        self.nodes = {}         # 添字から所属ノードを得るマッピング
+        pass
+
+    @staticmethod
+    def _contains(outer, inner):
+        return outer[0] <= inner[0] and outer[1] <= inner[1] and \
+            inner[2] <= outer[2] and inner[3] <= outer[3]
+
+    @staticmethod
+    def _quadrants(bounds):
+        x0, y0, x1, y1 = bounds
+        xm = (x0+x1)/2
+        ym = (y0+y1)/2
+        return [(x0, y0, xm, ym), (xm, y0, x1, ym),
+                (x0, ym, xm, y1), (xm, ym, x1, y1)]
+
+    def _child_for(self, node, bbox):
+        for child in node.children:
+            if self._contains(child.bounds, bbox):
+                return child
+        return None
+
+    def _split(self, node):
+        node.children = [_QuadNode(b, node.depth+1)
+                         for b in self._quadrants(node.bounds)]
+        items = node.items
+        node.items = set()
+        for i in items:
+            self._place(node, i, self.bboxes[i])
+        return
+
+    def _place(self, node, i, bbox):
+        while node.children is not None:
+            child = self._child_for(node, bbox)
+            if child is None:
+                break
+            node = child
+        node.items.add(i)
+        self.nodes[i] = node
+        if node.children is None and len(node.items) > self.capacity \
+           and node.depth < self.max_depth:
+            self._split(node)
+        return
+
+    def insert(self, i, bbox):
+        self.bboxes[i] = bbox
+        self._place(self.root, i, bbox)
+        return
+
+    def remove(self, i):
+        node = self.nodes.pop(i)
+        node.items.discard(i)
+        del self.bboxes[i]
+        return
+
+    def update(self, i, bbox):
+        node = self.nodes[i]
+        if self._contains(node.bounds, bbox) and \
+           (node.children is None or self._child_for(node, bbox) is None):
+            # 所属ノードが変わらなければバウンディングボックスのみ更新する
+            self.bboxes[i] = bbox
+            return
+        self.remove(i)
+        self.insert(i, bbox)
+        return
+
+    def query(self, bbox):
+        """
+        bboxと重なる可能性のあるオブジェクトの添字を返す。
+        """
+        ret = []
+        bboxes = self.bboxes
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for i in node.items:
+                if bbox_intersects(bbox, bboxes[i]):
+                    ret.append(i)
+            if node.children is not None:
+                for child in node.children:
+                    if bbox_intersects(bbox, child.bounds):
+                        stack.append(child)
+        return ret
+
+    def __len__(self):
+        return len(self.bboxes)
+
+
+def make_index(kind=None, **kwargs):
+    """
+    名前から空間インデックスを生成する。
+
+    - None, "list": 総当たり
+    - "grid": 一様格子。cell_sizeを指定する。
+    - "quadtree": 四分木。bounds=(xmin, ymin, xmax, ymax)を指定する。
+    """
+    if kind is None or kind == "list":
+        return ListIndex(**kwargs)
+    elif kind == "grid":
+        return GridIndex(**kwargs)
+    elif kind == "quadtree":
+        return QuadTreeIndex(**kwargs)
+    else:
+        raise ValueError(f"unknown index kind: {kind=}")
+
+
+# 格子で隣り合うセルの組。各セルの組を一度ずつ調べるよう、半分のみ。
+_HALF_NEIGHBORS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def bbox_pairs(bboxes, chunk=1 << 16):
+    """
+    (N, 4) のバウンディングボックスの配列から、bbox_intersectsで重なると判定
+    される添字の組をすべて求め、(I, J)（I < J）の配列を返す。順序は不定。
+
+    ボックスの幅・高さの最大値をセルの大きさとして、左下の角が属するセルに
+    分類するので、重なり得るのは隣り合うセルのボックスのみである。
+    メモリ使用量を抑えるため、chunk個ずつ処理する。
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    N = len(bboxes)
+    if N < 2:
+        return np.empty(0, np.intp), np.empty(0, np.intp)
+    extent = max(np.max(bboxes[:, 2] - bboxes[:, 0]),
+                 np.max(bboxes[:, 3] - bboxes[:, 1]))
+    # 丸め誤差で隣の隣のセルに分類されないよう、わずかに大きくとる
+    cell = extent*(1 + 1e-6) if extent > 0 else 1.0
+    gx = np.floor(bboxes[:, 0] / cell).astype(np.int64)
+    gy = np.floor(bboxes[:, 1] / cell).astype(np.int64)
+    gx -= gx.min()
+    gy -= gy.min() - 1           # 隣のセル（gy-1, gy+1）も同じ列に収める
+    ny = int(gy.max()) + 2
+    key = gx*ny + gy
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+
+    I_all = []
+    J_all = []
+    for start in range(0, N, chunk):
+        idx = np.arange(start, min(N, start + chunk))
+        for dx, dy in _HALF_NEIGHBORS:
+            target = key[idx] + dx*ny + dy
+            lo = np.searchsorted(sorted_key, target, side="left")
+            hi = np.searchsorted(sorted_key, target, side="right")
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            I = np.repeat(idx, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+                                                   counts)
+            J = order[np.repeat(lo, counts) + offsets]
+            if (dx, dy) == (0, 0):
+                keep = I < J
+                I, J = I[keep], J[keep]
+            a = bboxes[I]
+            b = bboxes[J]
+            keep = (a[:, 0] <= b[:, 2]) & (b[:, 0] <= a[:, 2]) & \
+                (a[:, 1] <= b[:, 3]) & (b[:, 1] <= a[:, 3])
+            I, J = I[keep], J[keep]
+            I_all.append(np.minimum(I, J))
+            J_all.append(np.maximum(I, J))
+    if not I_all:
+        return np.empty(0, np.intp), np.empty(0, np.intp)
+    return np.concatenate(I_all), np.concatenate(J_all)
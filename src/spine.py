@@ -2,7 +2,6 @@
 import numpy as np
 import math
 import logging
-import matplotlib
 from geometry import *
 
 logger = logging.getLogger(__name__)
@@ -53,10 +52,7 @@ class Spine(Segment):
         return
 
     def is_overlapped_with_spine(self, other: Segment) -> bool:
-        if self.relation(other) == Segment._NOTCROSS:
-            return False
-        else:
-            return True
+        return self.is_overlapped(other)
 
     def __repr__(self):
         return f"<Spine {self.identifier=}, ({self.center}, {self.theta=:.3f}, {self.l=:.3f})>"
@@ -66,3 +62,284 @@ class Spine(Segment):
                     self.theta+other.theta,
                     self.l + other.l)
         return self
+
+
+class SpineArray(object):
+    """
+    針の集合を構造体配列（SoA）で保持するコンテナ。
+    中心座標、角度、長さ、端点をそれぞれ連続したfloat64の配列で持つ。
+    要素を添字で取り出すとSpineViewが得られ、Spineと同様に扱える。
+    """
+    def __init__(self, cx, cy, theta, l, identifiers=None):
+        self.cx = np.array(cx, dtype=np.float64)
+        self.cy = np.array(cy, dtype=np.float64)
+        self.theta = np.array(theta, dtype=np.float64)
+        self.l = np.array(l, dtype=np.float64) * np.ones_like(self.cx)
+        # 識別子。Noneの場合は添字を文字列としたものを識別子とする
+        self.identifiers = identifiers
+
+        N = len(self.cx)
+        self.x1 = np.empty(N)
+        self.y1 = np.empty(N)
+        self.x2 = np.empty(N)
+        self.y2 = np.empty(N)
+        self._update_endpoints(slice(None))
+        pass
+
+    @classmethod
+    def from_spines(cls, spines):
+        """
+        Spineのリストから生成する。
+        """
+        identifiers = [s.identifier for s in spines]
+        if identifiers == [f"{i}" for i in range(len(spines))]:
+            identifiers = None
+        return cls([s.center.x for s in spines], [s.center.y for s in spines],
+                   [s.theta for s in spines], [s.l for s in spines],
+                   identifiers=identifiers)
+
+    @classmethod
+    def from_columns(cls, cx, cy, theta, l, x1, y1, x2, y2, identifiers=None):
+        """
+        端点を含むすべての列を与えて生成する。配列はコピーせずにそのまま保持
+        する（np.memmapなどを渡せる）。端点は与えた値を信用し、再計算しない。
+        """
+        self = cls.__new__(cls)
+        self.cx, self.cy, self.theta, self.l = cx, cy, theta, l
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.identifiers = identifiers
+        return self
+
+    def to_spines(self) -> list[Spine]:
+        """
+        独立したSpineのリストに変換する。
+        """
+        return [Spine(v.center, v.theta, v.l, identifier=v.identifier)
+                for v in self]
+
+    def _update_endpoints(self, idx):
+        dx = np.cos(self.theta[idx])*self.l[idx]/2
+        dy = np.sin(self.theta[idx])*self.l[idx]/2
+        self.x1[idx] = self.cx[idx] + dx
+        self.y1[idx] = self.cy[idx] + dy
+        self.x2[idx] = self.cx[idx] - dx
+        self.y2[idx] = self.cy[idx] - dy
+        return
+
+    def update(self, i, cx=None, cy=None, theta=None, l=None):
+        """
+        i番目の針の位置、角度、長さを更新する。
+        """
+        if cx is not None:
+            self.cx[i] = cx
+        if cy is not None:
+            self.cy[i] = cy
+        if theta is not None:
+            self.theta[i] = theta
+        if l is not None:
+            self.l[i] = l
+
+        t = float(self.theta[i])
+        half = float(self.l[i])/2
+        dx = math.cos(t)*half
+        dy = math.sin(t)*half
+        x = float(self.cx[i])
+        y = float(self.cy[i])
+        self.x1[i] = x + dx
+        self.y1[i] = y + dy
+        self.x2[i] = x - dx
+        self.y2[i] = y - dy
+        return
+
+    def update_many(self, idx, cx=None, cy=None, theta=None, l=None):
+        """
+        添字の配列idxで指定した針をまとめて更新する。
+        """
+        if cx is not None:
+            self.cx[idx] = cx
+        if cy is not None:
+            self.cy[idx] = cy
+        if theta is not None:
+            self.theta[idx] = theta
+        if l is not None:
+            self.l[idx] = l
+        self._update_endpoints(idx)
+        return
+
+    def identifier(self, i):
+        if self.identifiers is None:
+            return f"{i}"
+        return self.identifiers[i]
+
+    def copy(self):
+        return SpineArray(self.cx, self.cy, self.theta, self.l,
+                          identifiers=None if self.identifiers is None
+                          else list(self.identifiers))
+
+    @property
+    def nbytes(self):
+        """
+        配列が占めるバイト数
+        """
+        return sum(a.nbytes for a in (self.cx, self.cy, self.theta, self.l,
+                                      self.x1, self.y1, self.x2, self.y2))
+
+    def __len__(self):
+        return len(self.cx)
+
+    def __getitem__(self, i):
+        N = len(self.cx)
+        if i < 0:
+            i += N
+        if not 0 <= i < N:
+            raise IndexError(f"SpineArray index out of range: {i=}")
+        return SpineView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self.cx)):
+            yield SpineView(self, i)
+
+    def __repr__(self):
+        return f"<SpineArray N={len(self)}>"
+
+
+class SpineView(Spine):
+    """
+    SpineArrayの一要素をSpineとして扱うための薄いビュー。
+    値は保持せず、参照・更新はすべてSpineArrayの配列に対して行う。
+    """
+    def __init__(self, owner: SpineArray, index: int):
+        self.owner = owner
+        self.index = index
+        pass
+
+    @property
+    def center(self):
+        return Point(float(self.owner.cx[self.index]),
+                     float(self.owner.cy[self.index]))
+
+    @property
+    def theta(self):
+        return float(self.owner.theta[self.index])
+
+    @property
+    def l(self):
+        return float(self.owner.l[self.index])
+
+    @property
+    def identifier(self):
+        return self.owner.identifier(self.index)
+
+    @property
+    def p1(self):
+        return Point(float(self.owner.x1[self.index]),
+                     float(self.owner.y1[self.index]))
+
+    @property
+    def p2(self):
+        return Point(float(self.owner.x2[self.index]),
+                     float(self.owner.y2[self.index]))
+
+    def update(self, center: Point = None, theta=None, l=None):
+        """
+        針の位置、角度、長さを更新する。
+        """
+        if center is None:
+            self.owner.update(self.index, theta=theta, l=l)
+        else:
+            self.owner.update(self.index, center.x, center.y, theta, l)
+        return
+
+    def coords(self):
+        a = self.owner
+        i = self.index
+        return (float(a.x1[i]), float(a.y1[i]), float(a.x2[i]), float(a.y2[i]))
+
+    def bbox(self):
+        a = self.owner
+        i = self.index
+        x1, y1, x2, y2 = float(a.x1[i]), float(a.y1[i]), float(a.x2[i]), float(a.y2[i])
+        margin = 2*EPS / max(float(a.l[i]), EPS)
+        return (min(x1, x2) - margin, min(y1, y2) - margin,
+                max(x1, x2) + margin, max(y1, y2) + margin)
+
+    def __eq__(self, other):
+        return isinstance(other, SpineView) and self.owner is other.owner \
+            and self.index == other.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.owner), self.index))
+
+
+class SpineSnapshot(object):
+    """
+    針の配置（中心座標、角度、長さ）を平坦な配列として保存するスナップショット。
+    前回保存してから変更された添字をmarkで記録しておくことで、
+    captureとrestoreは変更分の書き込みだけで済む。
+    spinesはSpineのリストまたはSpineArray。
+    """
+    def __init__(self, spines):
+        if isinstance(spines, SpineArray):
+            self.cx = spines.cx.copy()
+            self.cy = spines.cy.copy()
+            self.theta = spines.theta.copy()
+            self.l = spines.l.copy()
+        else:
+            self.cx = np.array([s.center.x for s in spines], dtype=np.float64)
+            self.cy = np.array([s.center.y for s in spines], dtype=np.float64)
+            self.theta = np.array([s.theta for s in spines], dtype=np.float64)
+            self.l = np.array([s.l for s in spines], dtype=np.float64)
+        self.dirty = set()      # 保存後に変更された添字
+        pass
+
+    def mark(self, i):
+        """
+        i番目の針が変更されたことを記録する。
+        """
+        self.dirty.add(i)
+        return
+
+    def capture(self, spines):
+        """
+        現在の配置を保存する。変更された添字のみ書き込む。
+        """
+        if isinstance(spines, SpineArray):
+            idx = np.fromiter(self.dirty, dtype=np.intp, count=len(self.dirty))
+            self.cx[idx] = spines.cx[idx]
+            self.cy[idx] = spines.cy[idx]
+            self.theta[idx] = spines.theta[idx]
+            self.l[idx] = spines.l[idx]
+        else:
+            for i in self.dirty:
+                s = spines[i]
+                self.cx[i] = s.center.x
+                self.cy[i] = s.center.y
+                self.theta[i] = s.theta
+                self.l[i] = s.l
+        self.dirty.clear()
+        return
+
+    def restore(self, spines):
+        """
+        保存した配置に戻す。変更された添字のみ書き戻す。
+        ContactManagerの接触情報は更新しないので、必要なら呼び出し側で更新する。
+        """
+        if isinstance(spines, SpineArray):
+            idx = np.fromiter(self.dirty, dtype=np.intp, count=len(self.dirty))
+            spines.update_many(idx, self.cx[idx], self.cy[idx],
+                               self.theta[idx], self.l[idx])
+        else:
+            for i in self.dirty:
+                spines[i].update(Point(float(self.cx[i]), float(self.cy[i])),
+                                 float(self.theta[i]), float(self.l[i]))
+        self.dirty.clear()
+        return
+
+    def to_array(self) -> SpineArray:
+        """
+        保存した配置をSpineArrayとして取り出す。
+        """
+        return SpineArray(self.cx, self.cy, self.theta, self.l)
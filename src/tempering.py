@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# レプリカ交換法（パラレルテンパリング）による針の配置
+import logging
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from spine import SpineArray, SpineSnapshot
+from general import random_spine_array
+from contact_manager import ContactManager
+from anealing import metropolis_step, ALPHA, EPS
+
+logger = logging.getLogger(__name__)
+
+
+def temperature_ladder(K, t_min=ALPHA, t_max=1.0):
+    """
+    t_maxからt_minまで等比に並んだK個の温度を返す。
+    """
+    if K == 1:
+        return [t_min]
+    return [t_max * pow(t_min/t_max, k/(K-1)) for k in range(K)]
+
+
+def parallel_tempering(H, W, L, N, n_replicas=4, temperatures=None,
+                       exchange_interval=200, max_rounds=50, seed=0,
+                       max_workers=None, spines=None) -> SpineArray:
+    """
+    レプリカ交換法によってエネルギー０を目指す。
+
+    温度の異なるK個のレプリカをプロセスプールで並列にexchange_interval回ずつ
+    更新し、そのたびに隣り合う温度のレプリカ間で配置の交換を試みる。
+    いずれかのレプリカのエネルギーが０になるか、max_rounds回交換を行うと終了する。
+
+    temperatures: 各レプリカの温度。省略時はtemperature_ladder(n_replicas)。
+    seed: 乱数の種。各レプリカは種から導出した独立な乱数列を使う。
+    spines: 初期配置。Noneの場合はseedからランダムに生成する。
+
+    全レプリカを通じて最もエネルギーの低い配置をSpineArrayとして返す。
+    """
+    if temperatures is None:
+        temperatures = temperature_ladder(n_replicas)
+    K = len(temperatures)
+
+    if spines is None:
+        spines = random_spine_array(H, W, L, N, random.Random(seed))
+    elif not isinstance(spines, SpineArray):
+        spines = SpineArray.from_spines(spines)
+
+    # 各温度に一つずつ乱数列を割り当てる。交換では配置のみを入れ替える。
+    rng_states = [random.Random(f"{seed}:{k}").getstate() for k in range(K)]
+    exchange_rng = random.Random(f"{seed}:exchange")
+
+    states = [_layout(spines) for k in range(K)]
+    energies = [None]*K
+    best_e = None
+    best_layout = None
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for r in range(max_rounds):
+            futures = [executor.submit(_run_replica, H, W, L, states[k],
+                                       temperatures[k], exchange_interval,
+                                       rng_states[k])
+                       for k in range(K)]
+            for k, future in enumerate(futures):
+                states[k], energies[k], e, layout, rng_states[k] = \
+                    future.result()
+                if best_e is None or e < best_e:
+                    best_e = e
+                    best_layout = layout
+            logger.debug(f"round {r}: {energies=}, {best_e=}")
+
+            if best_e < EPS:
+                break
+
+            # 隣り合う温度のレプリカ間で交換を試みる。偶数・奇数の組を交互に。
+            for k in range(r % 2, K-1, 2):
+                d = (energies[k] - energies[k+1]) * \
+                    (1/temperatures[k] - 1/temperatures[k+1])
+                if d >= 0 or exchange_rng.uniform(0, 1) <= math.exp(d):
+                    states[k], states[k+1] = states[k+1], states[k]
+                    energies[k], energies[k+1] = energies[k+1], energies[k]
+
+    return SpineArray(*best_layout)
+
+
+def _layout(spines: SpineArray):
+    return (spines.cx.copy(), spines.cy.copy(), spines.theta.copy(),
+            spines.l.copy())
+
+
+def _run_replica(H, W, L, layout, t, n_steps, rng_state):
+    """
+    ワーカープロセスで一つのレプリカを温度tのもとでn_steps回更新する。
+
+    戻り値は (最終配置, 最終エネルギー, 最良エネルギー, 最良配置, 乱数の状態)。
+    """
+    rng = random.Random()
+    rng.setstate(rng_state)
+
+    spines = SpineArray(*layout)
+    cm = ContactManager.from_spines(spines, index="grid", cell_size=L)
+
+    e = cm.num_contact_pairs
+    best_e = e
+    best_state = SpineSnapshot(spines)
+    for step in range(n_steps):
+        if e < EPS:
+            break
+        e, move = metropolis_step(H, W, cm, e, t, rng)
+        if move is not None:
+            best_state.mark(move.index)
+            if e < best_e:
+                best_e = e
+                best_state.capture(spines)
+
+    best_layout = (best_state.cx, best_state.cy, best_state.theta,
+                   best_state.l)
+    return _layout(spines), e, best_e, best_layout, rng.getstate()
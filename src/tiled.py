@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# 領域分割による大規模な配置の生成。
+# 領域をタイルに分け、各タイルの針のみを動かすアニーリングをワーカープロセスで
+# 並列に行う。タイルの外側幅Lの範囲（ハロー）にある針は動かさない障害物とする。
+import logging
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from spine import SpineArray
+from general import random_spine_array
+from anealing import anealing
+
+logger = logging.getLogger(__name__)
+
+# 同時に処理するタイルの組。隣り合うタイルは別の組になる（市松模様）。
+PHASES = ((0, 0), (1, 0), (0, 1), (1, 1))
+
+
+def tiled(H, W, L, N, tile_size=None, sweeps=2, seed=0, max_workers=None,
+          spines=None, boundary_pass=True, info=None) -> SpineArray:
+    """
+    領域をタイルに分割し、タイルごとのアニーリングを並列に行って針の位置・向き
+    を求める。
+
+    1. 中心の位置によって各針をタイルに割り当てる
+    2. 市松模様の4つの組について順に、同じ組のタイルを並列に処理する。
+       タイルの針は中心がタイル内に留まるように動かし、ハローの針は動かさない。
+       同じ組のタイル同士はタイル一つ分離れているので、互いに影響しない。
+    3. 2をsweeps回繰り返す。すべてのタイルでエネルギーが０になれば打ち切る。
+    4. boundary_passがTrueの場合、接触が残ったタイルの針のみを動かすアニーリ
+       ングを領域全体で行い、タイルの境界をまたぐ接触を解消する。
+
+    tile_size: タイルの一辺の長さ。L以上であること。省略時は4L。
+    seed: 乱数の種。各タイルは種から導出した独立な乱数列を使うので、結果は
+    ワーカー数によらない。
+    spines: 初期配置。Noneの場合はseedからランダムに生成する。
+    info: dictを与えると、エネルギー（"energy"）、繰り返した回数（"epochs"）、
+    タイルの数（"tiles"）を書き込む。boundary_passがFalseの場合、エネルギーは
+    残った接触ペア数の上限である。
+
+    配置をSpineArrayとして返す。
+    """
+    if tile_size is None:
+        tile_size = 4*L
+    if tile_size < L:
+        raise ValueError(f"tile_size must be at least L: {tile_size=}, {L=}")
+
+    if spines is None:
+        spines = random_spine_array(H, W, L, N, random.Random(seed))
+    elif not isinstance(spines, SpineArray):
+        spines = SpineArray.from_spines(spines)
+
+    nx = max(1, math.ceil(W / tile_size))
+    ny = max(1, math.ceil(H / tile_size))
+    members = _assign(spines, nx, ny, tile_size)
+
+    energies = {}
+    sweep = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for sweep in range(sweeps):
+            energies = {}
+            for px, py in PHASES:
+                tiles = [(ix, iy) for iy in range(py, ny, 2)
+                         for ix in range(px, nx, 2)
+                         if len(members[iy*nx + ix])]
+                tasks = [_task(spines, members, nx, ny, ix, iy, tile_size, H, W,
+                               L, f"{seed}:{sweep}:{ix}:{iy}")
+                         for ix, iy in tiles]
+                workers = max_workers or os.cpu_count() or 1
+                chunksize = max(1, len(tasks) // (4*workers))
+                results = executor.map(_solve_tile, *zip(*tasks),
+                                       chunksize=chunksize) if tasks else []
+                for (ix, iy), (cx, cy, theta, e) in zip(tiles, results):
+                    spines.update_many(members[iy*nx + ix], cx, cy, theta)
+                    energies[(ix, iy)] = e
+            logger.debug("sweep %d: %d tiles in contact", sweep,
+                         sum(1 for e in energies.values() if e > 0))
+            if not any(energies.values()):
+                break
+
+    e = sum(energies.values())
+    if e > 0 and boundary_pass:
+        # 接触が残ったタイルの針のみを動かす
+        movable = np.concatenate([members[iy*nx + ix]
+                                  for (ix, iy), tile_e in energies.items()
+                                  if tile_e > 0])
+        boundary_info = {}
+        anealing(H, W, L, len(spines), spines=spines,
+                 rng=random.Random(f"{seed}:boundary"),
+                 movable=np.sort(movable).tolist(), info=boundary_info)
+        e = boundary_info["energy"]
+
+    if info is not None:
+        info["energy"] = e
+        info["epochs"] = sweep + 1
+        info["tiles"] = nx*ny
+    return spines
+
+
+def _assign(spines: SpineArray, nx, ny, tile_size):
+    """
+    中心の位置によって針をタイルに割り当て、タイルごとの添字の配列のリスト
+    （添字はiy*nx + ix）を返す。領域外の針は最も近いタイルに割り当てる。
+    """
+    ix = np.clip(np.floor(spines.cx / tile_size), 0, nx-1).astype(np.intp)
+    iy = np.clip(np.floor(spines.cy / tile_size), 0, ny-1).astype(np.intp)
+    tile = iy*nx + ix
+    order = np.argsort(tile, kind="stable")
+    bounds = np.searchsorted(tile[order], np.arange(nx*ny + 1))
+    return [order[bounds[k]:bounds[k+1]] for k in range(nx*ny)]
+
+
+def _task(spines, members, nx, ny, ix, iy, tile_size, H, W, L, seed):
+    """
+    一つのタイルの処理に必要な値をまとめる。
+    タイルの針を先頭に、ハローの針をその後に並べ、タイルの左下を原点とする。
+    """
+    x0, y0 = ix*tile_size, iy*tile_size
+    x1, y1 = min(W, x0 + tile_size), min(H, y0 + tile_size)
+    inner = members[iy*nx + ix]
+    neighbors = [members[jy*nx + jx]
+                 for jy in range(max(0, iy-1), min(ny, iy+2))
+                 for jx in range(max(0, ix-1), min(nx, ix+2))
+                 if (jx, jy) != (ix, iy)]
+    halo = np.concatenate(neighbors) if neighbors else np.empty(0, np.intp)
+    cx, cy = spines.cx[halo], spines.cy[halo]
+    halo = halo[(x0 - L <= cx) & (cx <= x1 + L) & (y0 - L <= cy) & (cy <= y1 + L)]
+    idx = np.concatenate([inner, halo])
+    return (y1 - y0, x1 - x0, L, x0, y0, spines.cx[idx], spines.cy[idx],
+            spines.theta[idx], spines.l[idx], len(inner), seed)
+
+
+def _solve_tile(H, W, L, x0, y0, cx, cy, theta, l, n_movable, seed):
+    """
+    ワーカープロセスで一つのタイルのアニーリングを行う。
+    戻り値は (タイルの針の中心x, 中心y, 角度, エネルギー)。
+    """
+    spines = SpineArray(cx - x0, cy - y0, theta, l)
+    info = {}
+    anealing(H, W, L, len(spines), spines=spines, rng=random.Random(seed),
+             movable=range(n_movable), info=info)
+    return (spines.cx[:n_movable] + x0, spines.cy[:n_movable] + y0,
+            spines.theta[:n_movable], info["energy"])
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# 生成過程の記録。描画とは切り離し、配置の推移をバイナリのログに書き出す。
+#
+# ログの形式（リトルエンディアン）
+#   ヘッダ: マジック b"SPTR", 版 uint32, 針の数 N uint32, H float64, W float64
+#   フレーム: 種別 uint8（0: 全体, 1: 差分）, epoch int64, エネルギー float64,
+#             件数 n uint32, [差分の場合のみ添字 int32 * n],
+#             中心x, 中心y, 角度, 長さ それぞれ float64 * n
+import logging
+import os
+import struct
+import numpy as np
+
+from spine import SpineArray
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SPTR"
+VERSION = 1
+_HEADER = struct.Struct("<4sIIdd")
+_FRAME = struct.Struct("<BqdI")
+_FULL = 0
+_DIFF = 1
+
+
+class NullRecorder(object):
+    """
+    何も記録しないレコーダー。ヘッドレスでの実行に用いる。
+    """
+    def mark(self, i):
+        return
+
+    def record(self, epoch, spines, energy):
+        return
+
+    def close(self):
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+        return
+
+
+class TrajectoryRecorder(NullRecorder):
+    """
+    配置の推移をバイナリのログに書き出すレコーダー。
+
+    mode: "full"の場合は毎フレーム全体を、"diff"の場合は前のフレームから変更
+    された針（markで記録したもの）のみを書き出す。diffでも最初のフレームは全体。
+    """
+    def __init__(self, path, H, W, mode="diff"):
+        if mode not in ("full", "diff"):
+            raise ValueError(f"unknown mode: {mode=}")
+        self.path = path
+        self.H = H
+        self.W = W
+        self.mode = mode
+        self.file = open(path, "wb")
+        self.N = None           # 最初のフレームで決まる
+        self.changed = set()    # 前のフレーム以降に変更された添字
+        pass
+
+    def mark(self, i):
+        """
+        i番目の針が変更されたことを記録する。
+        """
+        self.changed.add(i)
+        return
+
+    def record(self, epoch, spines, energy):
+        """
+        現在の配置をフレームとして書き出す。
+        """
+        if self.N is None:
+            self.N = len(spines)
+            self.file.write(_HEADER.pack(MAGIC, VERSION, self.N, self.H, self.W))
+            kind = _FULL
+        else:
+            kind = _FULL if self.mode == "full" else _DIFF
+
+        if kind == _FULL:
+            idx = None
+            values = _values(spines, range(self.N))
+        else:
+            idx = np.fromiter(sorted(self.changed), dtype=np.int32,
+                              count=len(self.changed))
+            values = _values(spines, idx)
+        self.changed.clear()
+
+        n = self.N if idx is None else len(idx)
+        self.file.write(_FRAME.pack(kind, epoch, energy, n))
+        if idx is not None:
+            self.file.write(idx.tobytes())
+        for v in values:
+            self.file.write(v.tobytes())
+        return
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        return
+
+
+def _values(spines, idx):
+    """
+    添字idxの針の中心x, 中心y, 角度, 長さを配列で返す。
+    """
+    if isinstance(spines, SpineArray):
+        idx = np.asarray(idx, dtype=np.intp)
+        return (spines.cx[idx], spines.cy[idx], spines.theta[idx], spines.l[idx])
+    items = [spines[i] for i in idx]
+    return (np.array([s.center.x for s in items], dtype=np.float64),
+            np.array([s.center.y for s in items], dtype=np.float64),
+            np.array([s.theta for s in items], dtype=np.float64),
+            np.array([s.l for s in items], dtype=np.float64))
+
+
+def read_header(f):
+    """
+    ログのヘッダを読み、(N, H, W)を返す。
+    """
+    data = f.read(_HEADER.size)
+    if len(data) < _HEADER.size:
+        raise ValueError("truncated trajectory log")
+    magic, version, N, H, W = _HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a trajectory log: {magic=}, {version=}")
+    return N, H, W
+
+
+def read_trajectory(path):
+    """
+    ログを先頭から読み、フレームごとに (epoch, エネルギー, 配置) を返すジェネレータ。
+    配置は同じSpineArrayを更新しながら返すので、保持する場合はcopyすること。
+    一度もrecordしなかったレコーダーのログ（空のファイル）はフレームなしとする。
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        N, H, W = read_header(f)
+        spines = None
+        while True:
+            head = f.read(_FRAME.size)
+            if len(head) < _FRAME.size:
+                return
+            kind, epoch, energy, n = _FRAME.unpack(head)
+            if kind == _DIFF:
+                idx = np.fromfile(f, dtype=np.int32, count=n)
+            cx, cy, theta, l = (np.fromfile(f, dtype=np.float64, count=n)
+                                for k in range(4))
+            if kind == _FULL:
+                spines = SpineArray(cx, cy, theta, l)
+            else:
+                spines.update_many(idx, cx, cy, theta, l)
+            yield epoch, energy, spines
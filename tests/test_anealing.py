@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import random
+
+from anealing import anealing
+from schedule import GeometricSchedule
+
+
+def test_short_schedule():
+    # 40回未満の反復でも記録の間隔が０にならない
+    info = {}
+    spines = anealing(10, 10, 3, 60, rng=random.Random(0), info=info,
+                      schedule=GeometricSchedule(20))
+    assert len(spines) == 60
+    assert info["epochs"] <= 20
+
+
+def test_deterministic_with_seed():
+    a = anealing(10, 10, 3, 30, rng=random.Random(1))
+    b = anealing(10, 10, 3, 30, rng=random.Random(1))
+    assert [s.coords() for s in a] == [s.coords() for s in b]
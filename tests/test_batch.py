@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+from batch import main, run_batch, run_one
+
+
+def test_finished_run_is_not_timed_out():
+    # 反復に入る前に終わった場合は、時間の上限を過ぎていても打ち切りではない
+    record = run_one("rsa", 10, 10, 1, 5, 0, time_budget=0.0)
+    assert record["energy"] == 0
+    assert not record["timed_out"]
+
+
+def test_run_batch_time_budget():
+    out = io.StringIO()
+    grid = {"H": [10], "W": [10], "L": [3], "N": [60]}
+    assert run_batch(grid, range(2), out, max_workers=1, time_budget=0.0) == 2
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["seed"] for r in sorted(records, key=lambda r: r["seed"])] == [0, 1]
+    assert all(r["timed_out"] for r in records)
+
+
+def test_main_time_budget(tmp_path):
+    path = tmp_path / "out.jsonl"
+    main(["--N", "60", "--seeds", "0", "1", "--workers", "1",
+          "--time-budget", "0", "--out", str(path)])
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]["timed_out"]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# callbackで中断し、チェックポイントから再開した結果が、中断しなかった場合と
+# 同じになることの確認
+import random
+
+from anealing import anealing, resume_anealing
+from checkpoint import Checkpointer, load_checkpoint, resume
+from relaxation import relaxation
+from schedule import GeometricSchedule
+
+
+def stop_at(n):
+    def callback(epoch, e, stats):
+        return epoch >= n
+    return callback
+
+
+def run_anealing(**kwargs):
+    info = {}
+    spines = anealing(10, 10, 3, 80, rng=random.Random(0), info=info,
+                      proposal="adaptive", schedule=GeometricSchedule(600),
+                      **kwargs)
+    return [s.coords() for s in spines], info
+
+
+def run_relaxation(**kwargs):
+    info = {}
+    spines = relaxation(10, 10, 3, 120, rng=random.Random(0), info=info,
+                        **kwargs)
+    return [s.coords() for s in spines], info
+
+
+def test_anealing_resume_matches_uninterrupted(tmp_path):
+    path = tmp_path / "anealing.ckpt"
+    expected = run_anealing()
+    interrupted = run_anealing(callback=stop_at(250),
+                               checkpoint=Checkpointer(path, interval=None,
+                                                       every=100))
+    assert interrupted[1]["epochs"] == 250
+    assert load_checkpoint(path)["epoch"] == 200
+
+    info = {}
+    spines = resume(path, info=info)
+    assert [s.coords() for s in spines] == expected[0]
+    assert info == expected[1]
+
+
+def test_relaxation_resume_matches_uninterrupted(tmp_path):
+    path = tmp_path / "relaxation.ckpt"
+    expected = run_relaxation()
+    interrupted = run_relaxation(callback=stop_at(25),
+                                 checkpoint=Checkpointer(path, interval=None,
+                                                         every=10))
+    assert interrupted[1]["epochs"] == 25
+    assert load_checkpoint(path)["epoch"] == 20
+
+    info = {}
+    spines = resume(path, info=info)
+    assert [s.coords() for s in spines] == expected[0]
+    assert info == expected[1]
+
+
+def test_resume_anealing_keeps_unspecified_limits(tmp_path):
+    path = tmp_path / "anealing.ckpt"
+    anealing(10, 10, 3, 80, rng=random.Random(0),
+             schedule=GeometricSchedule(100, time_budget=1.0e6),
+             checkpoint=Checkpointer(path, interval=None, every=1000))
+
+    state = load_checkpoint(path)
+    resume_anealing(state, max_iteration=150)
+    assert state["schedule"].max_iteration == 150
+    assert state["schedule"].time_budget == 1.0e6
+
+    state = load_checkpoint(path)
+    resume_anealing(state, time_budget=2.0e6)
+    assert state["schedule"].max_iteration == 100
+    assert state["schedule"].time_budget == 2.0e6
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# ContactManagerの一括登録（from_spines/bulk_register）が、registerを順に呼ん
+# だ場合と同じ状態になることの確認
+import random
+
+import pytest
+
+from contact_manager import ContactManager
+from general import random_spines
+from spatial_index import ListIndex
+
+H, W = 10, 10
+
+INDEXES = [
+    ("list", {}),
+    ("grid", {"cell_size": 2.0}),
+    ("grid", {"cell_size": 0.5}),
+    ("quadtree", {"bounds": (0, 0, W, H), "capacity": 4}),
+]
+
+
+class MinimalIndex(object):
+    """
+    insert/remove/update/queryのみを持つ空間インデックス。
+    """
+    def __init__(self):
+        self._index = ListIndex()
+        pass
+
+    def insert(self, i, bbox):
+        self._index.insert(i, bbox)
+        return
+
+    def remove(self, i):
+        self._index.remove(i)
+        return
+
+    def update(self, i, bbox):
+        self._index.update(i, bbox)
+        return
+
+    def query(self, bbox):
+        return self._index.query(bbox)
+
+
+def state(cm):
+    return ([sorted(e) for e in cm.E], list(cm.contacted), cm.version,
+            cm.num_contact_pairs)
+
+
+def sequential(spines, index, options):
+    cm = ContactManager(index=index, **options)
+    for s in spines:
+        cm.register(s)
+    return cm
+
+
+@pytest.mark.parametrize("L", [1.0, 3.0])
+@pytest.mark.parametrize("index, options", INDEXES)
+def test_from_spines_matches_register(index, options, L):
+    spines = random_spines(H, W, L, 200, random.Random(0))
+    expected = sequential(spines, index, options)
+    cm = ContactManager.from_spines(spines, index=index, **options)
+    assert state(cm) == state(expected)
+
+
+@pytest.mark.parametrize("index, options", INDEXES)
+def test_bulk_register_after_register(index, options):
+    spines = random_spines(H, W, 2.0, 150, random.Random(1))
+    expected = sequential(spines, index, options)
+    cm = sequential(spines[:50], index, options)
+    cm.bulk_register(spines[50:])
+    assert state(cm) == state(expected)
+
+
+def test_bulk_register_with_minimal_index():
+    spines = random_spines(H, W, 2.0, 150, random.Random(2))
+    expected = sequential(spines, "list", {})
+    cm = ContactManager.from_spines(spines, index=MinimalIndex())
+    assert state(cm) == state(expected)
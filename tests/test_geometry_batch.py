@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# geometryの配列版（*_batch）がPointによる実装と同じ結果を返すことの確認
+import math
+import random
+
+import numpy as np
+import pytest
+
+from geometry import (EPS, INF, Point, Line, Segment, iSP, iSP_batch,
+                      line_relation_batch, segment_overlap_batch,
+                      segment_relation_batch, segment_intersection_batch,
+                      segment_intersection_matrix)
+
+
+def random_segments(rng, n, size=10.0):
+    return [Segment(Point(rng.uniform(0, size), rng.uniform(0, size)),
+                    Point(rng.uniform(0, size), rng.uniform(0, size)))
+            for i in range(n)]
+
+
+def collinear_segments(rng, n):
+    """
+    同じ直線上（またはEPS程度ずれた直線上）の線分。重なるもの、端点で接するも
+    の、離れているものを含む。
+    """
+    ret = []
+    for i in range(n):
+        t1, t2 = rng.uniform(-2, 2), rng.uniform(-2, 2)
+        offset = rng.choice([0.0, 0.5*EPS, 2*EPS])
+        ret.append(Segment(Point(t1, t1 + offset), Point(t2, t2 + offset)))
+    # 端点で接する
+    ret.append(Segment(Point(0.0, 0.0), Point(1.0, 1.0)))
+    ret.append(Segment(Point(1.0, 1.0), Point(2.0, 2.0)))
+    return ret
+
+
+def parallel_segments():
+    return [Segment(Point(0.0, y), Point(1.0, y))
+            for y in (0.0, 0.5*EPS, 2*EPS, 1.0)] + \
+        [Segment(Point(0.5, 0.0), Point(1.5, 0.0)),
+         Segment(Point(2.0, 0.0), Point(3.0, 0.0))]
+
+
+def degenerate_segments():
+    """
+    長さ０の線分、EPS程度の長さの線分、他の線分の端点・内部に載る点。
+    """
+    return [Segment(Point(0.0, 0.0), Point(0.0, 0.0)),
+            Segment(Point(0.5, 0.5), Point(0.5, 0.5)),
+            Segment(Point(0.5, 0.0), Point(0.5, 0.0)),
+            Segment(Point(1.0, 1.0), Point(1.0 + EPS, 1.0)),
+            Segment(Point(0.3, 0.3), Point(0.3, 0.3 + 0.5*EPS)),
+            Segment(Point(0.0, 0.0), Point(1.0, 1.0)),
+            Segment(Point(0.0, 1.0), Point(1.0, 0.0))]
+
+
+def near_eps_segments():
+    """
+    端点が他の線分からEPS前後だけ離れている線分。
+    """
+    ret = [Segment(Point(0.0, 0.0), Point(1.0, 0.0))]
+    for d in (0.0, 0.5*EPS, EPS, 1.5*EPS, -0.5*EPS, -EPS, -1.5*EPS):
+        ret.append(Segment(Point(0.5, d), Point(0.5, 1.0)))
+        ret.append(Segment(Point(1.0 + d, 0.0), Point(2.0, 1.0)))
+        ret.append(Segment(Point(-1.0, d), Point(2.0, d)))
+    return ret
+
+
+CASES = {
+    "random": lambda: random_segments(random.Random(0), 60),
+    "collinear": lambda: collinear_segments(random.Random(1), 30),
+    "parallel": parallel_segments,
+    "degenerate": degenerate_segments,
+    "near_eps": near_eps_segments,
+    "mixed": lambda: random_segments(random.Random(2), 20, size=1.0) +
+    collinear_segments(random.Random(3), 10) + parallel_segments() +
+    degenerate_segments() + near_eps_segments(),
+}
+
+
+def as_array(segments):
+    return np.array([s.coords() for s in segments], dtype=np.float64)
+
+
+@pytest.fixture(params=sorted(CASES))
+def segments(request):
+    return CASES[request.param]()
+
+
+def test_iSP_batch(segments):
+    points = [p for s in segments for p in (s.p1, s.p2)]
+    a, b, c = zip(*[(s.p1, s.p2, p) for s in segments for p in points])
+    expected = [iSP(*abc) for abc in zip(a, b, c)]
+    got = iSP_batch(np.array([p.x for p in a]), np.array([p.y for p in a]),
+                    np.array([p.x for p in b]), np.array([p.y for p in b]),
+                    np.array([p.x for p in c]), np.array([p.y for p in c]))
+    assert got.tolist() == expected
+
+
+def test_relation_and_overlap(segments):
+    s = as_array(segments)
+    relation = segment_relation_batch(s[:, None, :], s[None, :, :])
+    overlap = segment_overlap_batch(s[:, None, :], s[None, :, :])
+    line_relation = line_relation_batch(s[:, None, :], s[None, :, :])
+    for i, a in enumerate(segments):
+        for j, b in enumerate(segments):
+            assert relation[i, j] == a.relation(b), (i, j)
+            assert overlap[i, j] == a.is_overlapped(b), (i, j)
+            assert line_relation[i, j] == Line.relation(a, b), (i, j)
+
+
+def test_intersection_matches_cross(segments):
+    s = as_array(segments)
+    overlap, relation, points = segment_intersection_matrix(s, s)
+    for i, a in enumerate(segments):
+        for j, b in enumerate(segments):
+            assert relation[i, j] == a.relation(b), (i, j)
+            assert overlap[i, j] == (a.relation(b) != Segment._NOTCROSS)
+            x, y = points[i, j]
+            if not overlap[i, j]:
+                assert x == INF and y == INF
+                continue
+            expected = a.cross(b)
+            if expected is None:
+                assert math.isnan(x) and math.isnan(y), (i, j)
+            elif expected is INF:
+                assert x == INF and y == INF, (i, j)
+            else:
+                assert (x, y) == (expected.x, expected.y), (i, j)
+
+
+def test_one_to_many_broadcast():
+    segments = CASES["mixed"]()
+    s = as_array(segments)
+    for i, a in enumerate(segments):
+        overlap, relation, points = segment_intersection_batch(s[i], s)
+        matrix_overlap, matrix_relation, matrix_points = \
+            segment_intersection_matrix(s[i:i+1], s)
+        assert overlap.tolist() == matrix_overlap[0].tolist()
+        assert relation.tolist() == matrix_relation[0].tolist()
+        np.testing.assert_array_equal(points, matrix_points[0])
+
+
+def test_invalid_shape():
+    with pytest.raises(ValueError):
+        segment_overlap_batch(np.zeros((3, 3)), np.zeros((3, 4)))
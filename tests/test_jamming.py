@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import random
+
+from contact_manager import ContactManager
+from general import random_spines
+from jamming import _probe, jamming, success_bound
+
+
+def test_short_probes():
+    info = {}
+    spines = jamming(3, 3, 1, probe_iterations=30, time_budget=5, info=info)
+    assert len(spines) == info["n"]
+    assert ContactManager.from_spines(spines).num_contact_pairs == 0
+    assert info["upper"] is None or info["upper"] > info["n"]
+
+
+def test_success_bound():
+    assert success_bound(0) == 1.0
+    assert success_bound(1, 0.95) == pytest.approx(0.95)
+    assert success_bound(10) < success_bound(5)
+
+
+def test_rejects_non_positive_max_attempts():
+    with pytest.raises(ValueError):
+        jamming(3, 3, 1, max_attempts=0)
+
+
+def test_probe_stops_on_plateau():
+    # 解消できない接触が残る配置では、patience回改善しなければ打ち切る
+    spines = random_spines(3, 3, 3, 40, random.Random(0))
+    result = _probe(3, 3, 3, spines, random.Random(0), 3000, None, 50, 0.5,
+                    "adaptive", None)
+    assert not result["feasible"]
+    assert result["epochs"] < 3000
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# 配置の保存・読み込み（layout）の往復の確認
+import random
+
+import numpy as np
+import pytest
+
+from contact_manager import ContactManager
+from general import random_spines
+from layout import COLUMNS, load_layout, read_layout_header, save_layout
+from spine import SpineArray
+
+
+def columns(spines):
+    return {name: np.asarray(getattr(spines, name)) for name in COLUMNS}
+
+
+@pytest.fixture
+def layout():
+    spines = SpineArray.from_spines(random_spines(10, 12, 3, 50,
+                                                  random.Random(0)))
+    edges = ContactManager.from_spines(spines).contact_edges()
+    assert len(edges) > 0
+    return spines, edges
+
+
+@pytest.mark.parametrize("mode", ["r", None])
+def test_round_trip(tmp_path, layout, mode):
+    spines, edges = layout
+    path = tmp_path / "layout.bin"
+    save_layout(path, 10, 12, spines, edges)
+    assert read_layout_header(path)[:4] == (50, len(edges), 10, 12)
+
+    H, W, loaded, loaded_edges = load_layout(path, mode=mode)
+    assert (H, W) == (10, 12)
+    assert len(loaded) == 50
+    for name, column in columns(spines).items():
+        np.testing.assert_array_equal(getattr(loaded, name), column)
+    assert list(loaded.identifiers) == [f"{i}" for i in range(50)]
+    np.testing.assert_array_equal(loaded_edges, edges)
+    np.testing.assert_array_equal(
+        ContactManager.from_spines(loaded).contact_edges(), edges)
+
+
+@pytest.mark.parametrize("mode", ["r", None])
+def test_round_trip_without_edges(tmp_path, layout, mode):
+    spines, edges = layout
+    path = tmp_path / "layout.bin"
+    save_layout(path, 10, 12, list(spines))
+    H, W, loaded, loaded_edges = load_layout(path, mode=mode)
+    assert loaded_edges is None
+    for name, column in columns(spines).items():
+        np.testing.assert_array_equal(getattr(loaded, name), column)
+
+
+@pytest.mark.parametrize("mode", ["r", None])
+def test_empty_layout(tmp_path, mode):
+    path = tmp_path / "empty.bin"
+    save_layout(path, 5, 5, [], np.empty((0, 2)))
+    H, W, loaded, edges = load_layout(path, mode=mode)
+    assert (H, W) == (5, 5)
+    assert len(loaded) == 0
+    assert edges.shape == (0, 2)
+
+
+def test_copy_on_write_does_not_touch_file(tmp_path, layout):
+    spines, edges = layout
+    path = tmp_path / "layout.bin"
+    save_layout(path, 10, 12, spines, edges)
+    before = path.read_bytes()
+    H, W, loaded, _ = load_layout(path, mode="c")
+    loaded.cx[:] = 0
+    del loaded
+    assert path.read_bytes() == before
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\0" * 100)
+    with pytest.raises(ValueError):
+        read_layout_header(path)
+    path.write_bytes(b"SPLY")
+    with pytest.raises(ValueError):
+        load_layout(path)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# relaxationの配列版（vectorized=True）がSpineによる実装と同じ結果を返すこと
+# の確認
+import random
+
+import numpy as np
+import pytest
+
+from contact_manager import ContactManager
+from general import random_spines
+from relaxation import relaxation
+
+
+def run(N, seed, vectorized):
+    trace = []
+
+    def callback(epoch, e, stats):
+        trace.append(e)
+        return False
+
+    info = {}
+    spines = relaxation(10, 10, 3, N,
+                        spines=random_spines(10, 10, 3, N, random.Random(seed)),
+                        info=info, vectorized=vectorized, callback=callback)
+    coords = np.array([spines[i].coords() for i in range(len(spines))])
+    return coords, info, trace, ContactManager.from_spines(spines)
+
+
+@pytest.mark.parametrize("N", [20, 60, 150])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_vectorized_matches_objects(N, seed):
+    coords, info, trace, cm = run(N, seed, vectorized=False)
+    v_coords, v_info, v_trace, v_cm = run(N, seed, vectorized=True)
+    assert v_info == info
+    assert v_trace == trace
+    np.testing.assert_allclose(v_coords, coords, rtol=0, atol=1.0e-8)
+    np.testing.assert_array_equal(v_cm.contact_edges(), cm.contact_edges())
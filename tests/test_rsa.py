@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from contact_manager import ContactManager
+from rsa import random_sequential_adsorption
+
+
+def test_rsa_without_contacts():
+    info = {}
+    spines = random_sequential_adsorption(10, 10, 3, 30, rng=random.Random(0),
+                                          info=info)
+    assert len(spines) == 30
+    assert info["energy"] == 0
+    assert ContactManager.from_spines(spines).num_contact_pairs == 0
+
+
+def test_rsa_rejects_non_positive_max_attempts():
+    with pytest.raises(ValueError):
+        random_sequential_adsorption(10, 10, 3, 5, max_attempts=0)
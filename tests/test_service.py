@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+from batch import run_one
+from service import (MIN_L, BadRequest, LayoutService, ResultCache,
+                     cache_key, handle, normalize)
+
+
+def test_normalize():
+    params = normalize({"H": 10, "W": 10, "L": 3, "N": 5})
+    assert params == {"H": 10.0, "W": 10.0, "L": 3.0, "N": 5, "seed": 0,
+                      "engine": "anealing"}
+    assert cache_key(params, "v1") == cache_key(dict(params), "v1")
+    assert cache_key(params, "v1") != cache_key(params, "v2")
+
+
+@pytest.mark.parametrize("params", [
+    [], {"H": 10, "W": 10, "L": 3}, {"H": 0, "W": 10, "L": 3, "N": 5},
+    {"H": 10, "W": 10, "L": 3, "N": -1}, {"H": 10, "W": 10, "L": 3, "N": 1.5},
+    {"H": 10, "W": 10, "L": 3, "N": 5, "engine": "x"},
+    {"H": 10, "W": 10, "L": 3, "N": 5, "extra": 1},
+    {"H": 10, "W": 10, "L": 3, "N": 101},
+])
+def test_normalize_rejects(params):
+    with pytest.raises(BadRequest):
+        normalize(params, max_n=100)
+
+
+def test_normalize_rejects_non_finite():
+    # json.loadsはInfinity, NaNを受け付ける
+    for text in ('{"H": Infinity, "W": 10, "L": 3, "N": 5}',
+                 '{"H": 10, "W": 10, "L": NaN, "N": 5}'):
+        with pytest.raises(BadRequest):
+            normalize(json.loads(text))
+
+
+def test_normalize_rejects_tiny_l():
+    with pytest.raises(BadRequest):
+        normalize({"H": 10, "W": 10, "L": 1e-5, "N": 5})
+    assert normalize({"H": 10, "W": 10, "L": MIN_L, "N": 5})["L"] == MIN_L
+
+
+def test_result_cache_lru(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")        # 最も古く参照されたbを削除する
+    assert cache.get("b") is None
+    assert cache.get("c") == b"3"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.json", "c.json"]
+    assert len(ResultCache(str(tmp_path), max_entries=2)) == 2
+
+
+def test_run_one_time_budget():
+    record = run_one("anealing", 10, 10, 3, 60, 0, time_budget=0.0)
+    assert record["timed_out"]
+    assert len(record["spines"]) == 60
+    assert not run_one("anealing", 10, 10, 3, 10, 0)["timed_out"]
+
+
+async def _request(port, body):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"POST /layout HTTP/1.1\r\nConnection: close\r\n"
+                 b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    await writer.drain()
+    # 接続が閉じられるまで読む
+    data = await asyncio.wait_for(reader.read(), timeout=30)
+    writer.close()
+    return data
+
+
+def test_service_end_to_end(tmp_path):
+    async def main():
+        service = LayoutService(max_workers=1, cache=ResultCache(str(tmp_path)),
+                                max_n=100)
+        server = await asyncio.start_server(
+            lambda r, w: handle(service, r, w), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            body = json.dumps({"H": 10, "W": 10, "L": 3, "N": 20}).encode()
+            first = await _request(port, body)
+            second = await _request(port, body)
+            too_many = await _request(
+                port, json.dumps({"H": 10, "W": 10, "L": 3, "N": 101}).encode())
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+        return first, second, too_many
+
+    first, second, too_many = asyncio.run(main())
+    assert first.startswith(b"HTTP/1.1 200") and b"X-Cache: miss" in first
+    assert second.startswith(b"HTTP/1.1 200") and b"X-Cache: hit" in second
+    assert first.split(b"\r\n\r\n", 1)[1] == second.split(b"\r\n\r\n", 1)[1]
+    assert too_many.startswith(b"HTTP/1.1 400")
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# 空間インデックス（list/grid/quadtree）が総当たりと同じ結果を返すことの確認
+import random
+
+import pytest
+
+from contact_manager import ContactManager
+from general import random_pose, random_spines
+from spatial_index import bbox_intersects, bbox_pairs, make_index
+
+H, W = 10, 10
+
+INDEXES = [
+    ("list", {}),
+    ("grid", {"cell_size": 1.0}),
+    ("grid", {"cell_size": 0.25, "max_span": 4}),
+    ("quadtree", {"bounds": (0, 0, W, H), "capacity": 2}),
+]
+
+
+def random_bbox(rng):
+    # 領域外にはみ出すものや、セルに比べて大きいものも含める
+    x, y = rng.uniform(-2, W+2), rng.uniform(-2, H+2)
+    w, h = rng.expovariate(1.0), rng.expovariate(1.0)
+    return (x, y, x + w, y + h)
+
+
+def brute_force(bboxes, bbox):
+    return {i for i, b in bboxes.items() if bbox_intersects(bbox, b)}
+
+
+@pytest.mark.parametrize("kind, options", INDEXES)
+def test_query_matches_brute_force(kind, options):
+    rng = random.Random(0)
+    index = make_index(kind, **options)
+    bboxes = {}
+    for step in range(2000):
+        op = rng.random()
+        if op < 0.4 or not bboxes:
+            i = step
+            bboxes[i] = random_bbox(rng)
+            index.insert(i, bboxes[i])
+        elif op < 0.8:
+            i = rng.choice(list(bboxes))
+            bboxes[i] = random_bbox(rng)
+            index.update(i, bboxes[i])
+        else:
+            i = rng.choice(list(bboxes))
+            del bboxes[i]
+            index.remove(i)
+        bbox = random_bbox(rng)
+        assert set(index.query(bbox)) == brute_force(bboxes, bbox)
+    assert len(index) == len(bboxes)
+
+
+def test_bbox_pairs_matches_brute_force():
+    rng = random.Random(1)
+    bboxes = [random_bbox(rng) for i in range(300)]
+    I, J = bbox_pairs(bboxes)
+    expected = {(i, j) for j in range(len(bboxes)) for i in range(j)
+                if bbox_intersects(bboxes[i], bboxes[j])}
+    assert set(zip(I.tolist(), J.tolist())) == expected
+    assert len(I) == len(expected)
+
+
+def contacts(spines):
+    N = len(spines)
+    return [{j for j in range(N)
+             if j != i and spines[i].is_overlapped_with_spine(spines[j])}
+            for i in range(N)]
+
+
+@pytest.mark.parametrize("kind, options", INDEXES)
+def test_contacts_after_moves(kind, options):
+    rng = random.Random(2)
+    spines = random_spines(H, W, 2.0, 120, rng)
+    cm = ContactManager.from_spines(spines, index=kind, **options)
+    for step in range(500):
+        x = spines[rng.randrange(len(spines))]
+        center, theta = random_pose(H, W, rng)
+        if step % 3 == 0:
+            x.update(center, theta)
+            cm.update(x)
+        else:
+            delta, move = cm.propose_move(x, center, theta)
+            if rng.random() < 0.5:
+                cm.commit(move)
+            else:
+                cm.rollback(move)
+    expected = contacts(spines)
+    assert cm.E == expected
+    assert cm.num_contact_pairs == sum(len(e) for e in expected) // 2
+    assert set(cm.contacted) == {i for i, e in enumerate(expected) if e}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from anealing import anealing
+from relaxation import relaxation
+from rsa import random_sequential_adsorption
+from schedule import GeometricSchedule
+from trajectory import TrajectoryRecorder, _values, read_trajectory
+
+
+def test_rsa_records_when_all_placed(tmp_path):
+    path = str(tmp_path / "rsa.log")
+    with TrajectoryRecorder(path, 10, 10) as recorder:
+        info = {}
+        spines = random_sequential_adsorption(10, 10, 1, 10,
+                                              rng=random.Random(0),
+                                              recorder=recorder, info=info)
+    assert info["placed"] == 10
+    frames = [(epoch, energy, s.copy()) for epoch, energy, s in
+              read_trajectory(path)]
+    assert len(frames) == 1
+    epoch, energy, recorded = frames[0]
+    assert (epoch, energy) == (0, 0)
+    assert recorded.cx.tolist() == [s.center.x for s in spines]
+
+
+def test_read_empty_log(tmp_path):
+    path = str(tmp_path / "empty.log")
+    TrajectoryRecorder(path, 10, 10).close()
+    assert list(read_trajectory(path)) == []
+
+
+class CapturingRecorder(TrajectoryRecorder):
+    """
+    書き出したフレームの内容を手元にも保持するレコーダー。
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.frames = []
+        pass
+
+    def record(self, epoch, spines, energy):
+        super().record(epoch, spines, energy)
+        self.frames.append((epoch, energy, [tuple(v.tolist()) for v in
+                                            _values(spines, range(len(spines)))]))
+        return
+
+
+def read_frames(path):
+    return [(epoch, energy, [tuple(v.tolist()) for v in
+                             (s.cx, s.cy, s.theta, s.l)])
+            for epoch, energy, s in read_trajectory(path)]
+
+
+@pytest.mark.parametrize("mode", ["diff", "full"])
+def test_anealing_round_trip(tmp_path, mode):
+    path = str(tmp_path / f"anealing-{mode}.log")
+    with CapturingRecorder(path, 10, 10, mode=mode) as recorder:
+        anealing(10, 10, 3, 40, rng=random.Random(0), recorder=recorder,
+                 schedule=GeometricSchedule(400))
+    assert len(recorder.frames) > 2
+    assert read_frames(path) == recorder.frames
+
+
+@pytest.mark.parametrize("mode", ["diff", "full"])
+def test_relaxation_round_trip(tmp_path, mode):
+    path = str(tmp_path / f"relaxation-{mode}.log")
+    with CapturingRecorder(path, 10, 10, mode=mode) as recorder:
+        relaxation(10, 10, 3, 40, rng=random.Random(0), recorder=recorder,
+                   vectorized=True)
+    assert len(recorder.frames) > 2
+    assert read_frames(path) == recorder.frames
+
+
+def test_diff_is_smaller_than_full(tmp_path):
+    sizes = {}
+    for mode in ("diff", "full"):
+        path = tmp_path / f"{mode}.log"
+        with TrajectoryRecorder(str(path), 10, 10, mode=mode) as recorder:
+            anealing(10, 10, 3, 40, rng=random.Random(0), recorder=recorder,
+                     schedule=GeometricSchedule(400))
+        sizes[mode] = path.stat().st_size
+    assert sizes["diff"] < sizes["full"]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        list(read_trajectory(str(path)))
+    path.write_bytes(b"SP")
+    with pytest.raises(ValueError):
+        list(read_trajectory(str(path)))